@@ -46,7 +46,7 @@ class MainUI:
         self.entry_keyword.grid(row=0, column=1, sticky="ew", padx=(0, 10), pady=5)
 
         ttk.Label(left_frame, text="音乐源:").grid(row=1, column=0, sticky="w", padx=10, pady=5)
-        self.combo_source = ttk.Combobox(left_frame, values=ALL_SOURCES, state="readonly")
+        self.combo_source = ttk.Combobox(left_frame, values=[FEDERATED_SOURCE] + ALL_SOURCES, state="readonly")
         self.combo_source.grid(row=1, column=1, sticky="ew", padx=(0, 10), pady=5)
 
         ttk.Label(left_frame, text="搜索类型:").grid(row=2, column=0, sticky="w", padx=10, pady=5)
@@ -101,8 +101,12 @@ class MainUI:
         button_container_frame.grid_columnconfigure(2, weight=1)
         self.btn_download = ttk.Button(button_container_frame, text="下载选中歌曲")
         self.btn_download.grid(row=0, column=1, pady=(0, 5), sticky="ew")
+        self.btn_download_next = ttk.Button(button_container_frame, text="优先下载选中歌曲")
+        self.btn_download_next.grid(row=1, column=1, pady=(0, 5), sticky="ew")
+        self.btn_queue = ttk.Button(button_container_frame, text="下载队列")
+        self.btn_queue.grid(row=2, column=1, pady=(0, 5), sticky="ew")
         self.btn_settings = ttk.Button(button_container_frame, text="设置")
-        self.btn_settings.grid(row=1, column=1, sticky="ew")
+        self.btn_settings.grid(row=3, column=1, sticky="ew")
 
         # progressbar
         status_frame = tk.Frame(self.root)
@@ -118,8 +122,12 @@ class MainUI:
                                        anchor='w')
         self.progress_label.grid(row=0, column=2, padx=(0, 10), pady=6, sticky="w")
 
-        # tk.Label(status_frame, text="↓", font=self.ui_font).grid(row=0, column=3, pady=6, sticky='w')
-        # self.speed_text_var = tk.StringVar(value="")
-        # self.speed_label = tk.Label(status_frame, textvariable=self.speed_text_var, font=self.ui_font, width=12,
-        #                             anchor='w')
-        # self.speed_label.grid(row=0, column=4, padx=(0, 10), pady=6, sticky="w")
\ No newline at end of file
+        self.api_rate_var = tk.StringVar(value="")
+        tk.Label(status_frame, textvariable=self.api_rate_var, font=self.ui_font, anchor='w').grid(
+            row=1, column=0, columnspan=3, padx=10, pady=(0, 6), sticky="w")
+
+        tk.Label(status_frame, text="↓", font=self.ui_font).grid(row=0, column=3, pady=6, sticky='w')
+        self.speed_text_var = tk.StringVar(value="")
+        self.speed_label = tk.Label(status_frame, textvariable=self.speed_text_var, font=self.ui_font, width=22,
+                                    anchor='w')
+        self.speed_label.grid(row=0, column=4, padx=(0, 10), pady=6, sticky="w")
\ No newline at end of file
@@ -0,0 +1,108 @@
+import threading
+
+from configure import *
+from ratelimit import AdaptiveRateLimiter
+from cache import CoverCache
+from transport import api_session, media_session, apply_transport_config, describe_pools
+
+api_limiter = AdaptiveRateLimiter(rate=API_RATE_INITIAL, min_rate=API_RATE_MIN, max_rate=API_RATE_MAX)
+cover_cache = CoverCache(COVER_CACHE_DIR, COVER_MEMORY_CACHE_BYTES, COVER_DISK_CACHE_BYTES)
+
+class RequestCancelled(Exception):
+    pass
+
+class CancelToken:
+    """
+    Lets another thread abandon requests: cancel() stops the wait for a rate-limit
+    token and closes the responses that are being read, which frees their connections.
+    One token can cover several concurrent requests.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.responses = set()
+        self.lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        with self.lock:
+            self.event.set()
+            responses, self.responses = self.responses, set()
+        for resp in responses:
+            resp.close()
+
+    def attach(self, resp):
+        with self.lock:
+            if not self.event.is_set():
+                self.responses.add(resp)
+                return
+        resp.close()
+        raise RequestCancelled()
+
+    def detach(self, resp):
+        with self.lock:
+            self.responses.discard(resp)
+
+def api_get(params, timeout=15, low_priority=False, cancel=None):
+    """
+    GET BASE_URL through the adaptive rate limiter and return the parsed json.
+    Timeouts, HTTP 429/5xx and an empty `url` field slow the limiter down.
+    low_priority requests (prefetch) leave a token to foreground requests.
+    cancel: optional CancelToken, raises RequestCancelled once it is cancelled.
+    """
+    if not api_limiter.acquire(reserve=1 if low_priority else 0,
+                               cancel_event=cancel.event if cancel else None):
+        raise RequestCancelled()
+    try:
+        if cancel is None:
+            resp = api_session.get(BASE_URL, params=params, timeout=timeout)
+        else:
+            # stream so the body can be abandoned by closing the response from another thread
+            resp = api_session.get(BASE_URL, params=params, timeout=timeout, stream=True)
+            cancel.attach(resp)
+            try:
+                resp.content
+            finally:
+                cancel.detach(resp)
+            if cancel.cancelled:
+                raise RequestCancelled()
+    except Exception as e:
+        # a response closed mid-read can fail in many ways, they all mean "cancelled"
+        if cancel is not None and cancel.cancelled:
+            raise RequestCancelled() from e
+        if isinstance(e, requests.exceptions.RequestException):
+            api_limiter.on_failure()
+        raise
+
+    if resp.status_code == 429 or resp.status_code >= 500:
+        api_limiter.on_failure()
+        resp.raise_for_status()
+
+    return record_api_result(params, resp.json())
+
+def record_api_result(params, data):
+    """
+    feed a parsed response back into api_limiter, an empty `url` counts as a failure
+    """
+    if params.get("types") == "url" and isinstance(data, dict) and not data.get("url"):
+        api_limiter.on_failure()
+    else:
+        api_limiter.on_success()
+    return data
+
+def get_cover(source, pic_id, size, timeout=15):
+    """
+    album cover bytes through cover_cache, None if the API has no cover for pic_id
+    """
+    def fetch():
+        pic_resp = api_get({"types": "pic", "source": source, "id": pic_id, "size": size}, timeout=timeout)
+        pic_url = pic_resp.get("url")
+        if not pic_url:
+            return None
+        cover_resp = media_session.get(pic_url, timeout=timeout)
+        cover_resp.raise_for_status()
+        return cover_resp.content
+
+    return cover_cache.get(source, pic_id, size, fetch)
@@ -0,0 +1,337 @@
+import asyncio
+import threading
+
+# optional, without aiohttp create_engine() falls back to the threaded DownloadEngine
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from engine import *
+
+# blocking file work of the asyncio engine: buffered writes, tagging, segmented resumes
+file_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="aio-file")
+# transient aiohttp errors, on top of the ones retry.is_retryable knows
+ASYNC_RETRYABLE = (aiohttp.ClientError,) if aiohttp is not None else ()
+
+def create_engine(config):
+    """
+    the download engine selected by config["network_backend"]
+    """
+    if config.get("network_backend") == NETWORK_BACKENDS[1] and aiohttp is not None:
+        return AsyncDownloadEngine(config)
+    return DownloadEngine(config)
+
+async def api_get_async(session, params, timeout=15):
+    """
+    api_get on the event loop: same rate limiter and failure accounting, no thread per request
+    """
+    while True:
+        wait = api_limiter.try_acquire()
+        if not wait:
+            break
+        await asyncio.sleep(wait)
+    counted = False
+    try:
+        async with session.get(BASE_URL, params=params, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status == 429 or resp.status >= 500:
+                counted = True
+                api_limiter.on_failure()
+                resp.raise_for_status()
+            # the API doesn't always send a json content type
+            data = await resp.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        # a 429 / 5xx answer is raised from above, count it once like api_get does
+        if not counted:
+            api_limiter.on_failure()
+        raise
+    return record_api_result(params, data)
+
+async def fetch_lyric_async(session, source, song_id):
+    lyric_params = {"types": "lyric", "source": source, "id": song_id}
+    return lyric_from_data(await api_get_async(session, lyric_params))
+
+# (source, pic_id, size) -> task, so tracks sharing an album fetch its cover once; loop thread only
+cover_tasks = {}
+
+async def get_cover_async(session, source, pic_id, size):
+    data = cover_cache.lookup(source, pic_id, size)
+    if data is not None:
+        return data
+    key = (source, pic_id, size)
+    task = cover_tasks.get(key)
+    if task is None:
+        task = cover_tasks[key] = asyncio.ensure_future(fetch_cover_async(session, source, pic_id, size))
+        task.add_done_callback(lambda _: cover_tasks.pop(key, None))
+    # a cancelled track must not cancel the fetch other tracks wait for
+    return await asyncio.shield(task)
+
+async def fetch_cover_async(session, source, pic_id, size):
+    pic_resp = await api_get_async(session, {"types": "pic", "source": source, "id": pic_id, "size": size})
+    pic_url = pic_resp.get("url")
+    if not pic_url:
+        return None
+    async with session.get(pic_url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+        resp.raise_for_status()
+        data = await resp.read()
+    if data:
+        cover_cache.put(source, pic_id, size, data)
+    return data
+
+async def fetch_audio_async(session, music_url, music_file):
+    """
+    fetch_audio as a coroutine: resumes a .part file with a Range request and renames it once complete.
+    Chunks are collected up to the configured write buffer and written on file_executor, so the loop
+    never waits on the disk. Tracks are not split into segments, concurrency comes from running many tracks.
+    """
+    loop = asyncio.get_running_loop()
+    part_file = music_file + PART_SUFFIX
+    if os.path.exists(part_file + SEGMENTS_SUFFIX):
+        # left by the threaded engine, only fetch_segmented knows how to resume it
+        return await loop.run_in_executor(file_executor, fetch_audio, music_url, music_file)
+
+    offset = written_size(part_file)
+    headers = {"Range": f"bytes={offset}-"} if offset else None
+    timeout = aiohttp.ClientTimeout(sock_connect=30, sock_read=30)
+
+    async with session.get(music_url, headers=headers, timeout=timeout) as r:
+        if r.status == 416:
+            # nothing left to fetch, or the .part is not a prefix of this file anymore
+            _, total = parse_content_range(r.headers.get("Content-Range"))
+            if total is not None and total == offset == os.path.getsize(part_file):
+                discard_progress(part_file)
+                os.replace(part_file, music_file)
+                return
+            discard_progress(part_file)
+            os.remove(part_file)
+            return await fetch_audio_async(session, music_url, music_file)
+        r.raise_for_status()
+
+        if r.status == 206:
+            start, total = parse_content_range(r.headers.get("Content-Range"))
+            start = start or 0
+            mode = "r+b"
+        else:
+            # server ignored the Range header, start over
+            start, mode = 0, "wb"
+            total = int(r.headers["Content-Length"]) if "Content-Length" in r.headers else None
+
+        metrics.begin_transfer(music_file, start, total)
+        writer = await loop.run_in_executor(file_executor, open_part_writer, part_file, start, total, mode)
+        complete = False
+        try:
+            buffer = bytearray()
+            async for chunk in r.content.iter_chunked(transfer_options["read_chunk"]):
+                buffer += chunk
+                metrics.add_bytes(len(chunk), music_file)
+                wait = bandwidth_governor.reserve(len(chunk))
+                if wait:
+                    await asyncio.sleep(wait)
+                if len(buffer) >= writer.buffer_size:
+                    await loop.run_in_executor(file_executor, writer.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await loop.run_in_executor(file_executor, writer.write, bytes(buffer))
+            complete = True
+        finally:
+            # truncating preallocated space and fsync can block as long as the writes
+            await loop.run_in_executor(file_executor, writer.close, complete)
+
+    size = os.path.getsize(part_file)
+    if total is not None and size != total:
+        raise requests.exceptions.ContentDecodingError(f"文件不完整 ({size} / {total} 字节)，重试时将断点续传")
+    os.replace(part_file, music_file)
+
+async def timed_async(timer, name, coroutine):
+    with timer.phase(name):
+        return await coroutine
+
+async def async_download_worker(session, thread_str, song_id, song_name, artist, album, source, pic_id, bitrate,
+                                cover_size, lyric_mode, save_dir_music, save_dir_lyric, job_id=None):
+    """
+    download_worker as a coroutine: resolve, lyric, cover and transfer share the event loop,
+    only tagging and disk writes go to file_executor. Phases are retried and journaled like
+    in download_worker (journal commits are small enough to stay on the loop).
+    """
+    loop = asyncio.get_running_loop()
+    timer = PhaseTimer()
+    lyric_task = None
+    cover_task = None
+    music_file = None
+    done_phases = set()
+    retry_args = (thread_str, song_id, song_name, artist, album, source, pic_id, bitrate, cover_size, lyric_mode,
+                  save_dir_music, save_dir_lyric, job_id)
+
+    try:
+        download_journal.started(job_id)
+        music_data, done_phases = journaled_phases(job_id)
+        url_params = {"types": "url", "source": source, "id": song_id, "br": bitrate}
+        while True:
+            if music_data is None:
+                with timer.phase("resolve"):
+                    music_data = await retry_policy.call_async("resolve", lambda: api_get_async(session, url_params),
+                                                               ASYNC_RETRYABLE)
+            music_url = music_data.get("url")
+            if not music_url:
+                metrics.record_track(song_name, "error", timer.finish(), error="no url")
+                download_journal.finished(job_id, False, "no url")
+                download_queue.put(("error", (f"未能获取歌曲\n '{song_name}' \n的下载链接", retry_args)))
+                return
+
+            # started after the url so they don't take rate-limit tokens from the critical path
+            if lyric_mode != "不下载歌词" and lyric_task is None:
+                lyric_task = asyncio.ensure_future(timed_async(timer, "lyric", retry_policy.call_async(
+                    "lyric", lambda: fetch_lyric_async(session, source, song_id), ASYNC_RETRYABLE)))
+            if pic_id and cover_task is None:
+                cover_task = asyncio.ensure_future(timed_async(timer, "cover", retry_policy.call_async(
+                    "cover", lambda: get_cover_async(session, source, pic_id, cover_size), ASYNC_RETRYABLE)))
+
+            ext = url_extension(music_url)
+            music_file, lyric_file = track_paths(thread_str, song_name, artist, album, music_data.get("br", 0), ext,
+                                                 save_dir_music, save_dir_lyric)
+            if "resolve" not in done_phases:
+                download_journal.resolved(job_id, music_url, music_data.get("br", 0), music_file)
+
+            if "transfer" in done_phases and os.path.exists(music_file):
+                break
+            try:
+                with timer.phase("transfer"):
+                    await retry_policy.call_async("transfer", lambda: fetch_audio_async(session, music_url, music_file),
+                                                  ASYNC_RETRYABLE)
+            except Exception as e:
+                if "resolve" not in done_phases or not is_client_error(e):
+                    raise
+                # the url came from the journal and has expired, resolve it again
+                music_data, done_phases = None, set()
+                continue
+            download_journal.phase_done(job_id, "transfer")
+            break
+
+        with timer.phase("wait_metadata"):
+            final_lyric_content = await lyric_task if lyric_task else ""
+            cover_data = await cover_task if cover_task else None
+
+        with timer.phase("tag"):
+            await retry_policy.call_async("tag", lambda: loop.run_in_executor(
+                file_executor, save_track, music_file, lyric_file, ext, thread_str, song_name, artist, album,
+                source, song_id, music_data.get("br") or bitrate, bitrate, cover_size, lyric_mode,
+                final_lyric_content, cover_data))
+
+        timings = timer.finish()
+        metrics.record_track(song_name, "success", timings, os.path.getsize(music_file))
+        download_journal.finished(job_id, True)
+        download_queue.put(("success", (song_name, timings)))
+
+    except Exception as e:
+        if isinstance(e, asyncio.TimeoutError):
+            error_message = f"'{song_name}' \n下载时连接超时"
+        elif isinstance(e, aiohttp.ClientError):
+            error_message = f"'{song_name}' \n下载时发生网络错误: {e}"
+        else:
+            error_message = download_error_message(e, song_name)
+        metrics.record_track(song_name, "error", timer.finish(), error=error_message.replace("\n", ""))
+        if done_phases:
+            # the journaled url may have expired, resolve again next time
+            download_journal.forget_url(job_id)
+        download_journal.finished(job_id, False, error_message.replace("\n", ""))
+        download_queue.put(("error", (error_message, retry_args)))
+
+    finally:
+        for task in (lyric_task, cover_task):
+            if task and not task.done():
+                task.cancel()
+        metrics.end_transfer(music_file)
+
+class AsyncDownloadEngine(DownloadEngine):
+    """
+    DownloadEngine that runs every track as a coroutine on one event loop thread.
+    A feeder thread moves tasks from task_queue onto the loop while fewer than
+    pool_size tracks are in flight, so hundreds of tracks cost two threads plus file_executor.
+    Results still go through download_queue, whose listeners wake the Tk loop.
+    """
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.cond = threading.Condition(self.lock)
+        self.loop = None
+        self.session = None
+        self.threads = []
+
+    def configured_size(self, config):
+        return int(config.get("async_max_downloads", DEFAULT_CONFIG["async_max_downloads"]))
+
+    def start(self):
+        apply_transfer_config(self.config)
+        apply_transport_config(self.config)
+        self.pool_size = self.configured_size(self.config)
+        self.loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="aio-loop")
+        loop_thread.start()
+        self.session = asyncio.run_coroutine_threadsafe(self.open_session(), self.loop).result()
+        feeder = threading.Thread(target=self.feed_loop, daemon=True, name="aio-feeder")
+        feeder.start()
+        self.threads = [feeder, loop_thread]
+
+    async def open_session(self):
+        connector = aiohttp.TCPConnector(limit=ASYNC_CONNECTION_LIMIT)
+        return aiohttp.ClientSession(connector=connector, headers=api_session.headers)
+
+    def feed_loop(self):
+        while True:
+            with self.cond:
+                while not self.stopping and self.active_workers >= self.pool_size:
+                    self.cond.wait()
+                if self.stopping:
+                    return
+            task_args = task_queue.get()
+            if task_args is None:
+                # wake-up from shutdown
+                task_queue.task_done()
+                continue
+            with self.cond:
+                self.active_workers += 1
+            asyncio.run_coroutine_threadsafe(self.run_task(task_args), self.loop)
+
+    async def run_task(self, task_args):
+        try:
+            await async_download_worker(self.session, *task_args)
+        except Exception as e:
+            # the worker reports its own failures, this only catches a failing report (journal locked)
+            download_queue.put(("error", (download_error_message(e, task_args[2]), task_args)))
+        finally:
+            with self.cond:
+                self.active_workers -= 1
+                self.cond.notify_all()
+            task_queue.task_done()
+
+    def resize(self, max_downloads):
+        """
+        Set how many tracks may be in flight, takes effect as soon as tracks finish.
+        """
+        with self.cond:
+            self.pool_size = max_downloads
+            self.cond.notify_all()
+
+    def shutdown(self, drain=True, timeout=None):
+        if drain:
+            task_queue.join()
+        else:
+            try:
+                while True:
+                    task_queue.get_nowait()
+                    task_queue.task_done()
+            except queue.Empty:
+                pass
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+            # tracks already on the loop finish, like the threads of DownloadEngine
+            self.cond.wait_for(lambda: self.active_workers == 0, timeout)
+        task_queue.put(None)
+        feeder, loop_thread = self.threads
+        feeder.join(timeout)
+        asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        loop_thread.join(timeout)
+
+    def describe(self):
+        return f"{super().describe()} (asyncio)"
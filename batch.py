@@ -0,0 +1,137 @@
+from async_engine import *
+
+# seconds between byte progress lines while no track finishes
+BATCH_PROGRESS_INTERVAL = 5
+
+def parse_batch_file(path):
+    """
+    Read a batch file. One entry per line, fields separated by tabs (or spaces):
+        <source> <id> [name] [artist] [album] [pic_id]
+        playlist <playlist_id>
+    Empty lines and lines starting with # are ignored.
+    """
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = [field.strip() for field in (line.split("\t") if "\t" in line else line.split())]
+            if len(fields) < 2:
+                raise ValueError(f"{path}:{line_no}: 至少需要 <source> <id> 两列")
+            if fields[0] == "playlist":
+                entries.append(("playlist", fields[1]))
+            elif fields[0] in ALL_SOURCES:
+                fields += [""] * (6 - len(fields))
+                entries.append(("track", {
+                    "id": fields[1],
+                    "name": fields[2] or fields[1],
+                    "artist": fields[3] or "未知歌手",
+                    "album": fields[4] or "未知专辑",
+                    "source": fields[0],
+                    "pic_id": fields[5],
+                }))
+            else:
+                raise ValueError(f"{path}:{line_no}: 未知音乐源 '{fields[0]}'")
+    return entries
+
+def resolve_entries(entries):
+    """
+    expand playlist entries into songs
+    """
+    songs = []
+    for kind, value in entries:
+        if kind == "playlist":
+            resp = search({"types": "playlist", "id": value})
+            if not isinstance(resp, list):
+                raise ValueError(f"歌单 {value} 获取失败: {resp}")
+            print(f"歌单 {value}: {len(resp)} 首")
+            songs.extend(resp)
+        else:
+            songs.append(value)
+    return songs
+
+def run_batch(path, save_dir_music=None, save_dir_lyric=None, config=None):
+    """
+    Download everything listed in a batch file without the GUI.
+    Returns the number of failed tasks.
+    """
+    config = config if config is not None else load_config()
+    if not save_dir_music:
+        save_dir_music = config["default_music_path"]
+    if save_dir_music == "每次询问":
+        raise ValueError("未设置默认歌曲保存路径，请使用 --music-dir 指定")
+    os.makedirs(save_dir_music, exist_ok=True)
+
+    lyric_mode = config.get("lyric_mode", "同时内嵌歌词并下载.lrc歌词文件")
+    if lyric_mode in ["只下载.lrc歌词文件", "同时内嵌歌词并下载.lrc歌词文件"]:
+        if not save_dir_lyric:
+            save_dir_lyric = config["default_lyric_path"]
+        if save_dir_lyric == "每次询问":
+            save_dir_lyric = save_dir_music
+        os.makedirs(save_dir_lyric, exist_ok=True)
+    else:
+        save_dir_lyric = None
+
+    songs = resolve_entries(parse_batch_file(path))
+    if not songs:
+        print("没有需要下载的歌曲")
+        return 0
+
+    engine = create_engine(config)
+    total, skipped = engine.enqueue(songs, save_dir_music, save_dir_lyric)
+    if skipped:
+        print(f"{skipped} 首歌曲已在本地曲库中，已跳过")
+    engine.start()
+    return wait_for_downloads(engine, total)
+
+def resume_batch(config=None):
+    """
+    Finish the downloads an earlier run (GUI or batch) left unfinished in the journal, without the GUI.
+    Returns the number of failed tasks.
+    """
+    config = config if config is not None else load_config()
+    engine = create_engine(config)
+    jobs = engine.unfinished_jobs()
+    if not jobs:
+        print("没有未完成的下载")
+        return 0
+    total = engine.resume(jobs)
+    if len(jobs) > total:
+        print(f"{len(jobs) - total} 首歌曲已在本地曲库中，已跳过")
+    print(f"继续 {total} 首未完成的下载")
+    engine.start()
+    return wait_for_downloads(engine, total)
+
+def wait_for_downloads(engine, total):
+    """
+    Print every finished track until `total` are done, then shut the engine down and print a summary.
+    Returns the number of failed tasks.
+    """
+    completed = 0
+    errors = []
+    while completed < total:
+        try:
+            status, data = download_queue.get(timeout=BATCH_PROGRESS_INTERVAL)
+        except queue.Empty:
+            done, expected, _ = metrics.transfer_progress()
+            print(f"  传输中 {done / (1024 * 1024):.1f} / {expected / (1024 * 1024):.1f} MiB, "
+                  f"{format_speed(metrics.bytes_per_second())}, 剩余 {format_eta(metrics.eta(total - completed))}")
+            continue
+        completed += 1
+        if status == "error":
+            error_message, _ = data
+            errors.append(error_message.replace("\n", ""))
+            print(f"[{completed}/{total}] 失败: {errors[-1]}")
+        else:
+            song_name, timings = data
+            print(f"[{completed}/{total}] 完成: {song_name} ({format_timings(timings)})")
+
+    engine.shutdown()
+    print(f"下载完成。成功 {total - len(errors)} 个, 失败 {len(errors)} 个。")
+    print(f"传输 {metrics.bytes_total / (1024 * 1024):.1f} MiB, {metrics.tasks_per_minute():.1f} 首/分钟")
+    print(f"API 速率: {api_limiter.describe()}, 限速: {bandwidth_governor.describe()}")
+    if metrics.retries:
+        print("自动重试: " + ", ".join(f"{phase} {count}" for phase, count in metrics.retries.items()))
+    print(describe_pools())
+    return len(errors)
@@ -0,0 +1,558 @@
+"""
+Offline benchmarks, no network needed.
+    python benchmark.py tagging [--size-mb 50] [--dir DIR]
+    python benchmark.py lyrics [--songs 2000] [--lines 80]
+    python benchmark.py disk [--size-mb 64] [--streams 4] [--dir DIR ...]
+    python benchmark.py e2e [--tracks 100] [--concurrency 3] [--backend threads|asyncio] [--latency 0.05] ...
+    python benchmark.py library [--backend threads|asyncio]
+    python benchmark.py search [--latency 2]
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+# optional, peak RSS is reported as n/a without it (Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from mutagen.easyid3 import EasyID3
+from mutagen.id3 import ID3, TIT2, APIC, USLT
+from mutagen.flac import FLAC, Picture
+
+from lyrics import merge_lyrics, parse_lrc, format_timestamp
+from writer import PartWriter, FSYNC_MODES
+
+def read_io_counters():
+    """
+    bytes read / written by this process according to /proc/self/io, None where unavailable
+    """
+    try:
+        with open("/proc/self/io", "r") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (IOError, KeyError, ValueError):
+        return None
+
+def make_mp3(path, size):
+    """
+    mp3-like file: a small ID3 header without padding followed by `size` bytes of payload
+    """
+    with open(path, "wb") as f:
+        f.write(b"\xff\xfb\x90\x00" * (size // 4))
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text="original"))
+    tags.save(path, padding=lambda info: 0)
+
+def make_flac(path, size):
+    """
+    FLAC header (STREAMINFO + 8 KiB padding, like most encoders write) followed by `size` bytes of payload
+    """
+    streaminfo = struct.pack(">HH", 4096, 4096) + b"\x00" * 6
+    # 44100 Hz, 2 channels, 16 bit, 44100 * 60 samples
+    streaminfo += ((44100 << 44) | (1 << 41) | (15 << 36) | (44100 * 60)).to_bytes(8, "big")
+    streaminfo += b"\x00" * 16
+    with open(path, "wb") as f:
+        f.write(b"fLaC")
+        f.write(bytes([0]) + len(streaminfo).to_bytes(3, "big") + streaminfo)
+        f.write(bytes([0x80 | 1]) + (8192).to_bytes(3, "big") + b"\x00" * 8192)
+        f.write(b"\xff\xf8" * (size // 2))
+
+def legacy_embed(music_file, ext, song_name, artist, album, cover_data, lyric):
+    """
+    the two-pass tagging download_worker used before: EasyID3 save, then ID3 save
+    """
+    if ext == ".mp3":
+        audio = EasyID3(music_file)
+        audio['title'] = song_name
+        audio['artist'] = artist
+        audio['album'] = album
+        audio.save()
+        audio = ID3(music_file)
+        audio.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=cover_data))
+        audio.add(USLT(encoding=3, desc='Lyrics', text=lyric))
+        audio.save()
+    else:
+        audio = FLAC(music_file)
+        audio['title'] = song_name
+        audio['artist'] = artist
+        audio['album'] = album
+        picture = Picture()
+        picture.data = cover_data
+        picture.type = 3
+        picture.mime = 'image/jpeg'
+        audio.add_picture(picture)
+        audio['lyrics'] = lyric
+        audio.save()
+
+def measure(func):
+    io_before = read_io_counters()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    io_after = read_io_counters()
+    io = sum(io_after) - sum(io_before) if io_before and io_after else None
+    return elapsed, io
+
+def format_io(io):
+    return "n/a" if io is None else f"{io / (1024 * 1024):.1f} MiB"
+
+def bench_tagging(size_mb, directory):
+    """
+    First tag pass and a re-tag (e.g. a later lyric fix) with the old two-pass writer
+    and the single-pass embed_metadata, on synthetic files of size_mb.
+    """
+    from download import embed_metadata
+    size = size_mb * 1024 * 1024
+    cover_data = os.urandom(300 * 1024)
+    lyric = "\n".join(f"[{i // 60:02d}:{i % 60:02d}.00]line {i} " + "啦" * 20 for i in range(200))
+    work_dir = tempfile.mkdtemp(dir=directory)
+    print(f"tagging benchmark: {size_mb} MiB payload, 300 KiB cover, {len(lyric)} char lyric, dir {work_dir}")
+    print(f"{'format':<6} {'writer':<12} {'first tag':>10} {'I/O':>10} {'re-tag':>10} {'I/O':>10}")
+    try:
+        for ext, make in ((".mp3", make_mp3), (".flac", make_flac)):
+            for name in ("two-pass", "single-pass"):
+                path = os.path.join(work_dir, f"bench{ext}")
+                make(path, size)
+                if name == "two-pass":
+                    run = lambda: legacy_embed(path, ext, "title", "artist", "album", cover_data, lyric)
+                else:
+                    run = lambda: embed_metadata(path, ext, None, "title", "artist", "album", 500,
+                                                 "只内嵌歌词", lyric, cover_data)
+                first, first_io = measure(run)
+                lyric += "\n[99:00.00]fixed"
+                again, again_io = measure(run)
+                print(f"{ext[1:]:<6} {name:<12} {first:>9.3f}s {format_io(first_io):>10} "
+                      f"{again:>9.3f}s {format_io(again_io):>10}")
+                os.remove(path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def legacy_merge_lyrics(original_lrc, translated_lrc):
+    """
+    the merge_lyrics download.py used before: exact timestamp string match, one timestamp per line
+    """
+    lyric_dict = defaultdict(list)
+    lrc_line_regex = re.compile(r'(\[\d{2}:\d{2}[.:]\d{2,3}\])(.*)')
+    for line in original_lrc.splitlines():
+        match = lrc_line_regex.match(line)
+        if match:
+            timestamp, text = match.groups()
+            lyric_dict[timestamp].append(text.strip())
+    for line in translated_lrc.splitlines():
+        match = lrc_line_regex.match(line)
+        if match:
+            timestamp, text = match.groups()
+            if timestamp in lyric_dict:
+                lyric_dict[timestamp].append(text.strip())
+            else:
+                lyric_dict[timestamp].insert(0, "")
+                lyric_dict[timestamp].append(text.strip())
+    merged_lines = []
+    for timestamp, texts in sorted(lyric_dict.items()):
+        if len(texts) == 1:
+            merged_lines.append(f"{timestamp}{texts[0]}")
+        elif len(texts) > 1:
+            merged_lines.append(f"{timestamp}{texts[0]}")
+            merged_lines.append(f"{timestamp}{texts[1]}")
+    return "\n".join(merged_lines)
+
+def make_lyric_pair(rng, lines):
+    """
+    original / translation LRC pair the way the sources return them: the translation uses
+    another timestamp precision or separator, drifts by a few ms, and the chorus lines of
+    the original carry several timestamps
+    """
+    times = sorted(rng.sample(range(0, 300000, 10), lines))
+    original = ["[ti:bench]", "[offset:0]"]
+    translated = []
+    chorus = []
+    for index, ms in enumerate(times):
+        if index % 10 == 9:
+            chorus.append(format_timestamp(ms))
+            continue
+        original.append(f"{format_timestamp(ms)}line {index} " + "啦" * 10)
+    original.append("".join(chorus) + "chorus")
+    for index, ms in enumerate(times):
+        drifted = ms + rng.choice((0, 0, -10, 10, 40))
+        style = index % 3
+        if style == 0:
+            timestamp = format_timestamp(drifted)
+        elif style == 1:
+            timestamp = f"[{drifted // 60000:02d}:{drifted // 1000 % 60:02d}.{drifted % 1000:03d}]"
+        else:
+            timestamp = f"[{drifted // 60000:02d}:{drifted // 1000 % 60:02d}:{drifted % 1000 // 10:02d}]"
+        translated.append(f"{timestamp}translation {index}")
+    return "\n".join(original), "\n".join(translated)
+
+def count_paired(merged):
+    """
+    translation lines that ended up right after an original line with the same timestamp
+    """
+    paired = 0
+    previous = None
+    for line in merged.splitlines():
+        timestamp, _, text = line.partition("]")
+        if text.startswith("translation") and previous is not None and previous[0] == timestamp and previous[1]:
+            paired += 1
+        previous = (timestamp, text and not text.startswith("translation"))
+    return paired
+
+def bench_lyrics(songs, lines):
+    """
+    merge time and number of aligned translations of the old and new merge_lyrics over a synthetic corpus
+    """
+    rng = random.Random(1)
+    corpus = [make_lyric_pair(rng, lines) for _ in range(songs)]
+    print(f"lyrics benchmark: {songs} songs x {lines} lines, {songs * lines} translations")
+    print(f"{'merger':<8} {'time':>9} {'per song':>10} {'aligned':>9}")
+    for name, merge in (("legacy", legacy_merge_lyrics), ("new", merge_lyrics)):
+        start = time.perf_counter()
+        merged = [merge(original, translated) for original, translated in corpus]
+        elapsed = time.perf_counter() - start
+        aligned = sum(count_paired(text) for text in merged)
+        print(f"{name:<8} {elapsed:>8.3f}s {elapsed * 1e6 / songs:>8.0f}us {aligned * 100 / (songs * lines):>8.1f}%")
+
+    start = time.perf_counter()
+    for original, translated in corpus:
+        parse_lrc(original)
+        parse_lrc(translated)
+    print(f"parse only: {time.perf_counter() - start:.3f}s")
+
+def legacy_write(path, data):
+    """
+    the old transfer loop: one f.write per 8 KiB chunk
+    """
+    with open(path, "wb") as f:
+        for start in range(0, len(data), 8192):
+            f.write(data[start:start + 8192])
+
+def writer_write(path, data, chunk, buffer_size, fsync_mode, allocate):
+    with PartWriter(path, 0, len(data), "wb", buffer_size, fsync_mode, allocate) as writer:
+        for start in range(0, len(data), chunk):
+            writer.write(data[start:start + chunk])
+
+def default_disk_dirs():
+    """
+    system temp (usually local disk) and tmpfs where there is one
+    """
+    dirs = [tempfile.gettempdir()]
+    if os.path.isdir("/dev/shm"):
+        dirs.append("/dev/shm")
+    return dirs
+
+def bench_disk(size_mb, streams, dirs):
+    """
+    `streams` files of size_mb written at once, like concurrent downloads, with the old
+    8 KiB loop and PartWriter variants. Chunks are sliced from memory, so only the write path is timed.
+    """
+    data = os.urandom(size_mb * 1024 * 1024)
+    variants = [
+        ("8 KiB loop", lambda path: legacy_write(path, data)),
+        ("256K/1M", lambda path: writer_write(path, data, 256 * 1024, 1024 * 1024, FSYNC_MODES[0], False)),
+        ("256K/1M alloc", lambda path: writer_write(path, data, 256 * 1024, 1024 * 1024, FSYNC_MODES[0], True)),
+        ("1M/4M alloc", lambda path: writer_write(path, data, 1024 * 1024, 4 * 1024 * 1024, FSYNC_MODES[0], True)),
+        ("256K/1M alloc+fsync", lambda path: writer_write(path, data, 256 * 1024, 1024 * 1024, FSYNC_MODES[1], True)),
+    ]
+    print(f"disk benchmark: {streams} streams x {size_mb} MiB (variant: read chunk / write buffer)")
+    print(f"{'dir':<20} {'variant':<20} {'time':>8} {'MiB/s':>8} {'CPU':>8}")
+    for directory in dirs:
+        work_dir = tempfile.mkdtemp(dir=directory)
+        try:
+            for name, write in variants:
+                paths = [os.path.join(work_dir, f"stream{index}.part") for index in range(streams)]
+                threads = [threading.Thread(target=write, args=(path,)) for path in paths]
+                cpu = time.process_time()
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+                cpu = time.process_time() - cpu
+                print(f"{directory:<20} {name:<20} {elapsed:>7.3f}s {streams * size_mb / elapsed:>8.0f} {cpu:>7.3f}s")
+                for path in paths:
+                    os.remove(path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def percentile(values, fraction):
+    """
+    nearest-rank percentile, None for no values
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+def peak_rss():
+    """
+    peak resident set size of this process in MiB, None where unavailable
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def format_seconds(value):
+    return "n/a" if value is None else f"{value * 1000:.0f}ms"
+
+def bench_e2e(args):
+    """
+    Search and download against a local MockApiServer through the real search_worker,
+    download engine and download_worker; reports tracks/min, p50/p99 per phase and peak RSS.
+    """
+    from mock_api import MockApiServer
+    server = MockApiServer(latency=args.latency, bandwidth=args.bandwidth_kb * 1024, error_rate=args.error_rate,
+                           ranges=not args.no_range, size=int(args.size_mb * 1024 * 1024), audio_format=args.format)
+    api_url = server.start()
+    work_dir = tempfile.mkdtemp(dir=args.dir)
+    os.environ["OBLIVIONIS_API_URL"] = api_url
+    os.environ["OBLIVIONIS_DATA_DIR"] = os.path.join(work_dir, "data")
+    # imported only now, so configure picks up the mock server and the scratch data dir
+    import async_engine as app
+
+    try:
+        if args.api_rate:
+            app.api_limiter.rate = args.api_rate
+            app.api_limiter.max_rate = max(app.api_limiter.max_rate, args.api_rate)
+        app.search_cache.configure("关闭", 0, 0)
+        bandwidth = f"{args.bandwidth_kb} KiB/s" if args.bandwidth_kb else "unlimited"
+        print(f"e2e benchmark: mock API {api_url}, latency {args.latency}s, bandwidth {bandwidth}, "
+              f"error rate {args.error_rate}, "
+              f"{'no ' if args.no_range else ''}range support, {args.size_mb} MiB {args.format}")
+
+        # searches, one after another like a user paging through results
+        search_times = []
+        songs = []
+        for index in range(args.searches):
+            params = {"types": "search", "source": "netease", "name": f"bench {index}", "count": 20, "pages": 1}
+            start = time.perf_counter()
+            app.search_worker(params, index)
+            status, resp, _ = app.search_queue.get()
+            search_times.append(time.perf_counter() - start)
+            if status == "success":
+                songs.extend(resp)
+        while len(songs) < args.tracks:
+            songs.extend(app.search({"types": "search", "source": "kuwo", "name": f"fill {len(songs)}",
+                                     "count": 50, "pages": 1}))
+        songs = songs[:args.tracks]
+
+        backend = app.NETWORK_BACKENDS[1] if args.backend == "asyncio" else app.NETWORK_BACKENDS[0]
+        config = dict(app.DEFAULT_CONFIG, max_downloads=args.concurrency, async_max_downloads=args.concurrency,
+                      network_backend=backend, library_mode="关闭")
+        engine = app.create_engine(config)
+        if args.backend == "asyncio" and not isinstance(engine, app.AsyncDownloadEngine):
+            print("aiohttp is not installed, using the threaded engine")
+        music_dir = os.path.join(work_dir, "music")
+        lyric_dir = os.path.join(work_dir, "lyrics")
+        os.makedirs(music_dir)
+        os.makedirs(lyric_dir)
+
+        start = time.perf_counter()
+        queued, _ = engine.enqueue(songs, music_dir, lyric_dir)
+        engine.start()
+        phases = defaultdict(list)
+        failures = 0
+        for _ in range(queued):
+            status, data = app.download_queue.get()
+            if status == "success":
+                for name, seconds in data[1].items():
+                    phases[name].append(seconds)
+            else:
+                failures += 1
+        elapsed = time.perf_counter() - start
+        engine.shutdown()
+
+        print(f"\nsearch: {len(search_times)} requests, p50 {format_seconds(percentile(search_times, 0.5))}, "
+              f"p99 {format_seconds(percentile(search_times, 0.99))}")
+        print(f"download: {queued} tracks with {engine.describe()}, {failures} failed, {elapsed:.2f}s, "
+              f"{(queued - failures) * 60 / elapsed:.1f} tracks/min")
+        print(f"{'phase':<14} {'p50':>8} {'p99':>8}")
+        for name, values in phases.items():
+            print(f"{name:<14} {format_seconds(percentile(values, 0.5)):>8} {format_seconds(percentile(values, 0.99)):>8}")
+        rss = peak_rss()
+        print(f"\npeak RSS: {'n/a' if rss is None else f'{rss:.1f} MiB'}")
+        print(f"API rate: {app.api_limiter.describe()}")
+        print("retries: " + (", ".join(f"{phase} {count}" for phase, count in app.metrics.retries.items()) or "none"))
+        print(app.describe_pools())
+        print("mock server: " + ", ".join(f"{name} {count}" for name, count in sorted(server.counts.items())))
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def start_mock_app(server, work_dir):
+    """
+    point the app at a started MockApiServer and a scratch data dir, then import it
+    """
+    os.environ["OBLIVIONIS_API_URL"] = server.start()
+    os.environ["OBLIVIONIS_DATA_DIR"] = os.path.join(work_dir, "data")
+    # imported only now, so configure picks up the mock server and the scratch data dir
+    import async_engine as app
+    app.api_limiter.rate = app.api_limiter.max_rate = 100
+    return app
+
+def check(name, ok, detail=""):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    return ok
+
+def run_downloads(app, engine, songs, music_dir, failures):
+    """
+    enqueue songs and wait for them, returns (queued, skipped)
+    """
+    queued, skipped = engine.enqueue(songs, music_dir, None)
+    for _ in range(queued):
+        status, data = app.download_queue.get(timeout=60)
+        if status != "success":
+            failures.append(data[0])
+    return queued, skipped
+
+def check_library(args):
+    """
+    Library index re-download rules against a source that caps mp3 at 320 kbps:
+    a track asked for at 999 and delivered at 320 is skipped on the next 999 run,
+    a track asked for at 128 is upgraded when 320 is asked for.
+    """
+    from mock_api import MockApiServer
+    server = MockApiServer(latency=0.01, size=256 * 1024, max_bitrate=320)
+    work_dir = tempfile.mkdtemp(dir=args.dir)
+    app = start_mock_app(server, work_dir)
+    try:
+        backend = app.NETWORK_BACKENDS[1] if args.backend == "asyncio" else app.NETWORK_BACKENDS[0]
+        config = dict(app.DEFAULT_CONFIG, network_backend=backend, lyric_mode="不下载歌词", default_bitrate="999")
+        engine = app.create_engine(config)
+        music_dir = os.path.join(work_dir, "music")
+        os.makedirs(music_dir)
+        engine.start()
+        songs = [{"id": f"capped{index}", "name": f"capped {index}", "artist": "a", "album": "b",
+                  "source": "netease", "pic_id": ""} for index in range(4)]
+        failures = []
+        results = [
+            check("requested 999, delivered 320: downloaded", run_downloads(app, engine, songs, music_dir, failures) == (4, 0)),
+            check("requested 999 again: skipped", run_downloads(app, engine, songs, music_dir, failures) == (0, 4)),
+        ]
+        config["default_bitrate"] = "320"
+        results.append(check("requested 320: skipped", run_downloads(app, engine, songs, music_dir, failures) == (0, 4)))
+        config["default_bitrate"] = "128"
+        low = [dict(song, id=f"low{index}") for index, song in enumerate(songs)]
+        results.append(check("requested 128: downloaded", run_downloads(app, engine, low, music_dir, failures) == (4, 0)))
+        config["default_bitrate"] = "320"
+        results.append(check("requested 320 after 128: upgraded",
+                             run_downloads(app, engine, low, music_dir, failures) == (4, 0)))
+        results.append(check("downloads", not failures, "; ".join(failures)))
+        engine.shutdown()
+        print(f"url requests: {server.counts.get('url', 0)} (expected 12)")
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if not all(results):
+        sys.exit(1)
+
+def check_search(args):
+    """
+    Latency of a superseding search: with every API answer taking `latency` seconds, search A
+    is submitted and replaced by B half a second later. B must arrive about `latency` after
+    its own submission, not after A's answer, and A must report nothing. Plain and federated.
+    """
+    from mock_api import MockApiServer
+    server = MockApiServer(latency=args.latency)
+    work_dir = tempfile.mkdtemp(dir=args.dir)
+    app = start_mock_app(server, work_dir)
+    results = []
+    try:
+        app.search_cache.configure("关闭", 0, 0)
+        manager = app.SearchManager()
+        for name, federated in (("plain", None), ("federated", (app.ALL_SOURCES, ""))):
+            params = lambda keyword: {"types": "search", "source": "netease", "name": f"{name} {keyword}",
+                                      "count": 20, "pages": 1}
+            first_id, second_id = len(results) + 1, len(results) + 2
+            manager.submit(params("a"), first_id, federated)
+            time.sleep(0.5)
+            start = time.perf_counter()
+            manager.submit(params("b"), second_id, federated)
+            stale = 0
+            while True:
+                status, _, search_id = app.search_queue.get(timeout=args.latency * 5)
+                stale += search_id == first_id
+                if search_id == second_id and status in ("success", "done"):
+                    break
+            elapsed = time.perf_counter() - start
+            results.append(check(f"{name}: superseding search answered after {elapsed:.2f}s",
+                                 elapsed < args.latency + 0.5, f"limit {args.latency + 0.5:.1f}s"))
+            # the abandoned search ends when its answer comes in, it must not report anything
+            time.sleep(args.latency)
+            while not app.search_queue.empty():
+                stale += app.search_queue.get()[2] == first_id
+            results.append(check(f"{name}: superseded search reported nothing", not stale, f"{stale} messages"))
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if not all(results):
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Oblivionis offline benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    tagging = subparsers.add_parser("tagging", help="two-pass vs single-pass tag writing")
+    tagging.add_argument("--size-mb", type=int, default=50)
+    tagging.add_argument("--dir", default=None, help="directory for the temporary files (default: system temp)")
+
+    lyrics = subparsers.add_parser("lyrics", help="old vs new lyric merge on a synthetic corpus")
+    lyrics.add_argument("--songs", type=int, default=2000)
+    lyrics.add_argument("--lines", type=int, default=80)
+
+    disk = subparsers.add_parser("disk", help="8 KiB write loop vs buffered, preallocated PartWriter")
+    disk.add_argument("--size-mb", type=int, default=64)
+    disk.add_argument("--streams", type=int, default=4, help="files written at once")
+    disk.add_argument("--dir", nargs="+", default=None, help="directories to compare (default: system temp and /dev/shm)")
+
+    e2e = subparsers.add_parser("e2e", help="search and download against a local mock API")
+    e2e.add_argument("--tracks", type=int, default=100)
+    e2e.add_argument("--searches", type=int, default=20)
+    e2e.add_argument("--concurrency", type=int, default=3, help="max_downloads / async_max_downloads")
+    e2e.add_argument("--backend", choices=["threads", "asyncio"], default="threads")
+    e2e.add_argument("--latency", type=float, default=0.05, help="mock server seconds per response")
+    e2e.add_argument("--bandwidth-kb", type=int, default=0, help="mock server KiB/s per transfer, 0 = unlimited")
+    e2e.add_argument("--error-rate", type=float, default=0.0)
+    e2e.add_argument("--no-range", action="store_true")
+    e2e.add_argument("--size-mb", type=float, default=5)
+    e2e.add_argument("--format", choices=["mp3", "flac", "mixed"], default="mp3")
+    e2e.add_argument("--api-rate", type=float, default=100,
+                     help="starting API requests/s, 0 keeps the app's own limiter settings")
+    e2e.add_argument("--dir", default=None, help="directory for the temporary files (default: system temp)")
+
+    library = subparsers.add_parser("library", help="library index skip / upgrade rules against a capped mock source")
+    library.add_argument("--backend", choices=["threads", "asyncio"], default="threads")
+    library.add_argument("--dir", default=None, help="directory for the temporary files (default: system temp)")
+
+    search = subparsers.add_parser("search", help="latency of a search that supersedes a slow one")
+    search.add_argument("--latency", type=float, default=2.0, help="mock server seconds per response")
+    search.add_argument("--dir", default=None, help="directory for the temporary files (default: system temp)")
+
+    args = parser.parse_args()
+    if args.command == "tagging":
+        bench_tagging(args.size_mb, args.dir)
+    elif args.command == "lyrics":
+        bench_lyrics(args.songs, args.lines)
+    elif args.command == "disk":
+        bench_disk(args.size_mb, args.streams, args.dir or default_disk_dirs())
+    elif args.command == "e2e":
+        bench_e2e(args)
+    elif args.command == "library":
+        check_library(args)
+    elif args.command == "search":
+        check_search(args)
+
+if __name__ == "__main__":
+    main()
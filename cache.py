@@ -0,0 +1,412 @@
+import os
+import json
+import atexit
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_MODES = ["开启", "关闭", "绕过 (只刷新不读取)"]
+
+class SearchCache:
+    """
+    On-disk LRU cache of search results keyed by the normalized search params.
+    Entries expire after `ttl` seconds, at most `max_entries` are kept.
+    mode: 开启 = read and write, 关闭 = do nothing, 绕过 = always fetch but refresh the cache
+    The file is written by a timer `save_delay` seconds after a put, so a burst of searches
+    costs one write and no search waits for the disk.
+    """
+    def __init__(self, path, mode="开启", ttl=3600, max_entries=200, save_delay=2.0):
+        self.path = path
+        self.save_delay = save_delay
+        self.save_timer = None
+        self.mode = mode
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> [timestamp, resp]
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # serializes writers, so an older snapshot can't replace a newer one
+        self.save_lock = threading.Lock()
+        self.load()
+        atexit.register(self.flush)
+
+    def configure(self, mode, ttl, max_entries):
+        with self.lock:
+            self.mode = mode
+            self.ttl = ttl
+            self.max_entries = max_entries
+            self._evict()
+
+    @staticmethod
+    def make_key(params):
+        normalized = {}
+        for key, value in params.items():
+            value = " ".join(str(value).split())
+            normalized[key] = value.casefold() if key == "name" else value
+        return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+    def get(self, params):
+        """
+        cached result for params, or None on miss / expired / cache not readable
+        """
+        if self.mode != "开启":
+            return None
+        key = self.make_key(params)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def contains(self, params):
+        """
+        like get() but without touching LRU order or hit counters
+        """
+        if self.mode != "开启":
+            return False
+        entry = self.entries.get(self.make_key(params))
+        return entry is not None and time.time() - entry[0] <= self.ttl
+
+    def put(self, params, resp):
+        if self.mode == "关闭" or not resp or not isinstance(resp, list):
+            return
+        key = self.make_key(params)
+        with self.lock:
+            self.entries[key] = [time.time(), resp]
+            self.entries.move_to_end(key)
+            self._evict()
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(self.save_delay, self.save)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+        self.save()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            for key, entry in data:
+                if now - entry[0] <= self.ttl:
+                    self.entries[key] = entry
+            self._evict()
+        except (IOError, ValueError, TypeError, IndexError):
+            self.entries.clear()
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                if self.save_timer is not None:
+                    self.save_timer.cancel()
+                    self.save_timer = None
+                data = json.dumps(list(self.entries.items()), ensure_ascii=False)
+            tmp_file = self.path + ".tmp"
+            try:
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_file, self.path)
+            except IOError:
+                pass
+
+    def flush(self):
+        """
+        write a pending save now instead of waiting for its timer (at exit)
+        """
+        with self.lock:
+            pending = self.save_timer is not None
+        if pending:
+            self.save()
+
+    def describe(self):
+        total = self.hits + self.misses
+        rate = self.hits * 100 / total if total else 0
+        return f"{len(self.entries)} 条缓存, 命中 {self.hits} / 未命中 {self.misses} (命中率 {rate:.0f}%)"
+
+class CoverCache:
+    """
+    Two-tier album cover cache keyed by (source, pic_id, size):
+    an in-memory LRU of image bytes bounded by `max_memory_bytes`, backed by a
+    content-addressed disk store (<directory>/<sha[:2]>/<sha>) with a key -> sha index.
+    The disk store is an LRU too, its blobs are bounded by `max_disk_bytes`; like
+    SearchCache the index is written by a timer `save_delay` seconds after a change.
+    Concurrent requests for the same key share a single fetch.
+    """
+    def __init__(self, directory, max_memory_bytes=32 * 1024 * 1024, max_disk_bytes=256 * 1024 * 1024,
+                 save_delay=2.0):
+        self.directory = directory
+        self.index_file = os.path.join(directory, "index.json")
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.save_delay = save_delay
+        self.save_timer = None
+        self.memory = OrderedDict()  # key -> bytes
+        self.memory_bytes = 0
+        self.index = OrderedDict()  # key -> [sha256, size], least recently used first
+        self.blob_refs = {}  # sha256 -> number of keys pointing at it
+        self.disk_bytes = 0
+        self.inflight = {}  # key -> [event, data, error]
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.lock = threading.Lock()
+        # serializes blob writes and removals
+        self.index_lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+        atexit.register(self.flush)
+
+    def lookup(self, source, pic_id, size):
+        """
+        cover bytes from memory or disk, None on a miss
+        """
+        key = f"{source}:{pic_id}:{size}"
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return data
+            entry = self.index.get(key)
+            if entry is not None:
+                self.index.move_to_end(key)
+                self._schedule_save()
+
+        if entry is not None:
+            data = self._read_blob(entry[0])
+            with self.lock:
+                if data is not None:
+                    self.disk_hits += 1
+                    self._remember(key, data)
+                elif self.index.get(key) is entry:
+                    # the blob is gone, forget it
+                    self._unlink(key)
+                    self._schedule_save()
+            return data
+        return None
+
+    def put(self, source, pic_id, size, data):
+        """
+        store a cover fetched without get(), e.g. by the asyncio engine
+        """
+        with self.lock:
+            self.misses += 1
+        self._store(f"{source}:{pic_id}:{size}", data)
+
+    def get(self, source, pic_id, size, fetch):
+        """
+        Return the cover bytes, calling fetch() -> bytes or None only when neither
+        tier has the key and no other thread is already fetching it.
+        """
+        data = self.lookup(source, pic_id, size)
+        if data is not None:
+            return data
+
+        key = f"{source}:{pic_id}:{size}"
+        with self.lock:
+            # a leader may have stored the cover and left since the lookup above
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return data
+            slot = self.inflight.get(key)
+            leader = slot is None
+            if leader:
+                slot = self.inflight[key] = [threading.Event(), None, None]
+                self.misses += 1
+            else:
+                self.shared += 1
+        if not leader:
+            slot[0].wait()
+            if slot[2] is not None:
+                raise slot[2]
+            return slot[1]
+
+        try:
+            data = fetch()
+            if data:
+                self._store(key, data)
+            slot[1] = data
+            return data
+        except Exception as e:
+            slot[2] = e
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            slot[0].set()
+
+    def _blob_path(self, sha):
+        return os.path.join(self.directory, sha[:2], sha)
+
+    def _read_blob(self, sha):
+        try:
+            with open(self._blob_path(sha), "rb") as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def _store(self, key, data):
+        sha = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            self._remember(key, data)
+        # the disk tier is best effort, a failed write only costs a refetch next session
+        try:
+            with self.index_lock:
+                blob_path = self._blob_path(sha)
+                if not os.path.exists(blob_path):
+                    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                    tmp_file = f"{blob_path}.{threading.get_ident()}.tmp"
+                    with open(tmp_file, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_file, blob_path)
+                with self.lock:
+                    evicted = self._link(key, sha, len(data))
+                    self._schedule_save()
+                self._remove_blobs(evicted)
+        except IOError:
+            pass
+
+    def _link(self, key, sha, size):
+        """
+        point key at a blob as the most recently used entry, then evict down to max_disk_bytes.
+        Returns the blobs no key points at any more. Caller holds self.lock.
+        """
+        entry = self.index.get(key)
+        if entry is not None and entry[0] == sha:
+            self.index.move_to_end(key)
+            return []
+        evicted = self._unlink(key)
+        self.index[key] = [sha, size]
+        if not self.blob_refs.get(sha):
+            self.disk_bytes += size
+        self.blob_refs[sha] = self.blob_refs.get(sha, 0) + 1
+        # the newest entry stays even when it alone is over the budget
+        while self.disk_bytes > self.max_disk_bytes and len(self.index) > 1:
+            evicted += self._unlink(next(iter(self.index)))
+        return evicted
+
+    def _unlink(self, key):
+        """
+        drop key from the index, returns [sha] when that was the last key of its blob. Caller holds self.lock.
+        """
+        entry = self.index.pop(key, None)
+        if entry is None:
+            return []
+        sha, size = entry
+        self.blob_refs[sha] -= 1
+        if self.blob_refs[sha]:
+            return []
+        del self.blob_refs[sha]
+        self.disk_bytes -= size
+        return [sha]
+
+    def _remove_blobs(self, shas):
+        for sha in shas:
+            try:
+                os.remove(self._blob_path(sha))
+            except OSError:
+                pass
+
+    def _schedule_save(self):
+        """
+        caller holds self.lock
+        """
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(self.save_delay, self.save)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def load(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            data = []
+        # indexes written before the disk LRU were a {key: sha} dict without sizes
+        if isinstance(data, dict):
+            data = [[key, sha, None] for key, sha in data.items()]
+        evicted = []
+        for entry in data:
+            try:
+                key, sha, size = entry
+                if size is None:
+                    size = os.path.getsize(self._blob_path(sha))
+            except (OSError, TypeError, ValueError):
+                continue
+            evicted += self._link(key, sha, size)
+        self._remove_blobs(evicted)
+        # blobs whose index entry was never saved (the app was killed before the timer ran)
+        # would sit outside the budget forever; recent ones may be another running process's
+        stale = time.time() - 3600
+        try:
+            for name in os.listdir(self.directory):
+                folder = os.path.join(self.directory, name)
+                if len(name) != 2 or not os.path.isdir(folder):
+                    continue
+                for blob in os.listdir(folder):
+                    blob_path = os.path.join(folder, blob)
+                    if blob not in self.blob_refs and os.path.getmtime(blob_path) < stale:
+                        os.remove(blob_path)
+        except OSError:
+            pass
+        if evicted:
+            self.save()
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                if self.save_timer is not None:
+                    self.save_timer.cancel()
+                    self.save_timer = None
+                data = json.dumps([[key, sha, size] for key, (sha, size) in self.index.items()])
+            tmp_file = self.index_file + ".tmp"
+            try:
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_file, self.index_file)
+            except IOError:
+                pass
+
+    def flush(self):
+        """
+        write a pending index save now instead of waiting for its timer (at exit)
+        """
+        with self.lock:
+            pending = self.save_timer is not None
+        if pending:
+            self.save()
+
+    def _remember(self, key, data):
+        if key in self.memory:
+            self.memory_bytes -= len(self.memory.pop(key))
+        self.memory[key] = data
+        self.memory_bytes += len(data)
+        while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def describe(self):
+        return (f"封面: 内存命中 {self.hits} / 磁盘命中 {self.disk_hits} / 合并请求 {self.shared} / 下载 {self.misses}, "
+                f"磁盘 {self.disk_bytes / 1024 / 1024:.1f} MiB")
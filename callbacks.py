@@ -6,8 +6,7 @@ import webbrowser
 import threading
 import time
 
-from download import *
-from search import *
+from async_engine import *
 # from configure import *
 
 class AppCallbacks:
@@ -16,6 +15,7 @@ class AppCallbacks:
         self.ui = ui
         self.config = load_config()
         self.settings_window = None
+        self.queue_window = None
         self.download_errors = []
         self.failed_args = []
 
@@ -23,11 +23,32 @@ class AppCallbacks:
         self.current_source = ""
         self.current_search_type = ""
         self.current_page = 1
+        self.current_params = None
+        # federated search: normalized key -> (rank, position, song), and the sources that answered
+        self.federated_merged = {}
+        self.federated_songs = []
+        self.federated_answered = []
+        self.search_manager = SearchManager(SEARCH_DEBOUNCE)
+
+        # rows of song_list in display order, and item -> position
+        self.row_items = []
+        self.row_index = {}
+        self.populate_generation = 0
 
         self.ui.combo_source.set(self.config.get("default_source", "netease"))
         self.ui.combo_search_type.set(self.config.get("default_search_type", "单曲/歌手搜索"))
-        self.download_semaphore = threading.Semaphore(self.config.get("max_downloads", 3))
-        self.start_download_dispatcher()
+        apply_cache_config(self.config)
+        apply_prefetch_config(self.config)
+        self.engine = create_engine(self.config)
+        self.engine.start()
+
+        self.processing_queue = False
+        self.queue_rerun = False
+        self.queue_wake_pending = False
+        self.queue_timer = None
+        for ui_queue in (search_queue, pic_queue, download_queue):
+            ui_queue.listeners.append(self.wake_queue)
+        self.root.after_idle(self.offer_resume)
 
     def bind_callbacks(self):
         self.ui.link.bind("<Button-1>", self.open_url)
@@ -38,7 +59,10 @@ class AppCallbacks:
         self.ui.btn_prev_page.config(command=self.handle_prev_page)
         self.ui.btn_next_page.config(command=self.handle_next_page)
         self.ui.btn_download.config(command=self.download_selected)
+        self.ui.btn_download_next.config(command=lambda: self.download_selected(priority=True))
+        self.ui.btn_queue.config(command=self.open_queue_window)
         self.ui.btn_settings.config(command=self.open_settings)
+        self.root.bind("<<QueueWake>>", self.process_queue)
 
         self.root.bind_all("<Control-a>", self.tree_select_all, add='+')
         self.ui.song_list.bind("<Button-1>", self._tree_start_select, add='+')
@@ -46,18 +70,62 @@ class AppCallbacks:
         self.ui.song_list.bind("<ButtonRelease-1>", self._tree_end_select, add='+')
 
     # region update GUI
-    def update_song_list(self, resp):
+    def clear_song_list(self):
+        """
+        remove every row and stop any population still in progress
+        """
+        self.populate_generation += 1
         self.ui.song_list.delete(*self.ui.song_list.get_children())
+        self.row_items = []
+        self.row_index = {}
+
+    def update_song_list(self, resp, keep=None):
+        """
+        keep: (selected song keys, focused song key) from song_list_state(), restored on the new rows
+        """
+        self.clear_song_list()
         if not resp:
             messagebox.showinfo("搜索提示", "未找到相关结果")
             return
 
-        for song in resp:
+        # large playlists are inserted in chunks so the window stays responsive
+        self.insert_song_rows(resp, 0, self.populate_generation, keep)
+        self.ui.song_list.yview_moveto(0)
+
+    def song_list_state(self):
+        """
+        (set of selected song keys, focused song key or None), by normalize_song_key so it survives a rebuild
+        """
+        def row_key(item):
+            values = self.ui.song_list.item(item, "values")
+            return normalize_song_key({"name": values[1], "artist": values[2], "album": values[3]})
+        focus = self.ui.song_list.focus()
+        return ({row_key(item) for item in self.ui.song_list.selection()},
+                row_key(focus) if focus else None)
+
+    def insert_song_rows(self, resp, start, generation, keep=None):
+        if generation != self.populate_generation:
+            # replaced by a newer list
+            return
+        end = min(start + SONG_LIST_CHUNK, len(resp))
+        selected = []
+        for song in resp[start:end]:
             artist_str = ' / '.join(song["artist"]) if isinstance(song["artist"], list) else song["artist"]
-            self.ui.song_list.insert("", tk.END, values=(
+            item = self.ui.song_list.insert("", tk.END, values=(
                 song["id"], song["name"], artist_str, song["album"], song["source"], song.get("pic_id", "")
             ))
-        self.ui.song_list.yview_moveto(0)
+            self.row_index[item] = len(self.row_items)
+            self.row_items.append(item)
+            if keep:
+                key = normalize_song_key(song)
+                if key in keep[0]:
+                    selected.append(item)
+                if key == keep[1]:
+                    self.ui.song_list.focus(item)
+        if selected:
+            self.ui.song_list.selection_add(selected)
+        if end < len(resp):
+            self.root.after(1, self.insert_song_rows, resp, end, generation, keep)
 
     def update_album_cover(self, img_data):
         try:
@@ -69,43 +137,9 @@ class AppCallbacks:
         except Exception:
             self.ui.album_label.config(image=None, text="封面加载失败")
             self.ui.album_label.image = None
-
-    # def format_speed(self, bytes_per_second):
-    #     if bytes_per_second < 1024:
-    #         return f"{bytes_per_second} B/s"
-    #     elif bytes_per_second < 1024 * 1024:
-    #         return f"{bytes_per_second / 1024:.1f} KB/s"
-    #     else:
-    #         return f"{bytes_per_second / (1024 * 1024):.1f} MB/s"
     # endregion
 
     # region threading
-    def start_download_dispatcher(self):
-        dispatcher_thread = threading.Thread(target=self.download_dispatcher, daemon=True)
-        dispatcher_thread.start()
-
-    def download_dispatcher(self):
-        """
-        Pulls download tasks from a queue, starts a worker thread for each,
-        and waits for 5.1s before processing the next task.
-        Important: test if this blocks other thread!!!!!
-        """
-        while True:
-            if not task_queue.empty():
-                task_args = task_queue.get()
-                print(task_args)
-
-                thread = threading.Thread(
-                    target=download_worker,
-                    args=task_args,
-                    daemon=True
-                )
-                thread.start()
-
-                time.sleep(DOWNLOAD_INTERVAL)
-            else:
-                time.sleep(1)
-
     def handle_new_search(self):
         keyword = self.ui.entry_keyword.get().strip()
         if not keyword:
@@ -117,10 +151,16 @@ class AppCallbacks:
 
     def search_music(self, keyword, source, search_type, page=1):
         global search_id_counter
-        self.ui.song_list.delete(*self.ui.song_list.get_children())
+        self.clear_song_list()
         self.ui.song_list.insert("", tk.END, values=("", "正在搜索，请稍候...", "", "", "", ""))
         self.root.update_idletasks()
 
+        if source == FEDERATED_SOURCE and search_type != "网易云歌单搜索":
+            self.federated_search(keyword, search_type, page)
+            return
+        if source == FEDERATED_SOURCE:
+            # playlists only exist on netease
+            source = "netease"
         api_source = f"{source}_album" if search_type == "专辑搜索" else \
                         (f"{source}_playlist" if search_type == "网易云歌单搜索" else source)
         self.current_keyword = keyword
@@ -138,8 +178,69 @@ class AppCallbacks:
                 "types": "playlist", "id": self.current_keyword
             }
         search_id_counter += 1
-        thread = threading.Thread(target=search_worker, args=(params, search_id_counter), daemon=True)
-        thread.start()
+        self.current_params = params
+        cached = search_prefetcher.take(params)
+        if cached is None:
+            cached = search_cache.get(params)
+        if cached is not None:
+            self.search_manager.cancel()
+            self.update_song_list(cached)
+            self.prefetch_neighbors(params, cached)
+            return
+        self.search_manager.submit(params, search_id_counter)
+
+    def federated_search(self, keyword, search_type, page):
+        """
+        search every source in config["federated_sources"] at once, results are merged as they arrive
+        """
+        global search_id_counter
+        self.current_keyword = keyword
+        self.current_source = FEDERATED_SOURCE
+        self.current_search_type = search_type
+        self.current_page = page
+
+        sources = [source for source in self.config.get("federated_sources", ALL_SOURCES) if source in ALL_SOURCES]
+        params = {
+            "types": "search", "name": keyword,
+            "count": self.config.get("default_search_count", 20), "pages": page
+        }
+        suffix = "_album" if search_type == "专辑搜索" else ""
+        search_id_counter += 1
+        self.current_params = params
+        self.federated_merged = {}
+        self.federated_songs = []
+        self.federated_answered = []
+        self.search_manager.submit(params, search_id_counter, federated=(sources or ALL_SOURCES, suffix))
+
+    def update_federated_results(self, failed=None):
+        """
+        redraw the merged federated results; failed is only given once every source has answered.
+        Selection, focus and scroll position carry over, the user may already be picking songs.
+        """
+        if self.federated_songs:
+            view = self.ui.song_list.yview()[0]
+            self.update_song_list(self.federated_songs, self.song_list_state())
+            self.ui.song_list.yview_moveto(view)
+        elif failed is not None:
+            self.clear_song_list()
+            if failed and not self.federated_answered:
+                messagebox.showerror("搜索歌曲错误", "所有音乐源搜索失败:\n" + "\n".join(failed))
+            else:
+                messagebox.showinfo("搜索提示", "未找到相关结果")
+
+    def prefetch_neighbors(self, params, resp):
+        """
+        queue the pages next to a search result the user is likely to open next
+        """
+        mode = self.config.get("prefetch_mode", "预取下一页")
+        if mode == "关闭" or params.get("types") != "search" or "source" not in params or not isinstance(resp, list):
+            return
+        page = int(params["pages"])
+        # a short page is the last one
+        if len(resp) >= int(params["count"]):
+            search_prefetcher.request({**params, "pages": page + 1})
+        if mode == "预取上一页和下一页" and page > 1:
+            search_prefetcher.request({**params, "pages": page - 1})
 
     def handle_prev_page(self):
         if self.current_page > 1:
@@ -150,73 +251,162 @@ class AppCallbacks:
         self.current_page += 1
         self.search_music(self.current_keyword, self.current_source, self.current_search_type, self.current_page)
 
-    def process_queue(self):
+    def wake_queue(self):
+        """
+        Called from worker threads on every put into a UI queue. Posts one virtual event
+        so process_queue runs on the Tk thread; further puts are coalesced until it runs.
+        """
+        if self.queue_wake_pending:
+            return
+        self.queue_wake_pending = True
+        try:
+            self.root.event_generate("<<QueueWake>>", when="tail")
+        except (RuntimeError, tk.TclError):
+            # main loop not running (yet / anymore)
+            self.queue_wake_pending = False
+
+    def process_queue(self, event=None):
+        """
+        Drain every pending message of the search, pic and download queues, within
+        QUEUE_DRAIN_BUDGET seconds per run, then redraw progress once. Runs on
+        <<QueueWake>>; a timer is only kept while downloads are in progress.
+        """
         global search_id_counter, download_tasks_total, download_tasks_completed, all_downloads_succeeded
-        # handle searching queue
+        if self.processing_queue:
+            # re-entered from a dialog's nested event loop, run again once it returns
+            self.queue_rerun = True
+            return
+        self.processing_queue = True
+        self.queue_rerun = False
+        self.queue_wake_pending = False
+        deadline = time.perf_counter() + QUEUE_DRAIN_BUDGET
         try:
-            status, data, search_id = search_queue.get_nowait()
-            if search_id == search_id_counter:
+            # handle searching queue, only the latest result of the current search is shown,
+            # federated partial results are merged and drawn once per run
+            search_message = None
+            federated_changed = False
+            federated_failed = None
+            while time.perf_counter() < deadline:
+                try:
+                    message = search_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message[2] != search_id_counter:
+                    continue
+                if message[0] == "partial":
+                    source, songs = message[1]
+                    self.federated_answered.append(source)
+                    if songs:
+                        self.federated_songs = merge_federated(self.federated_merged, songs,
+                                                               self.config.get("federated_sources", ALL_SOURCES))
+                        federated_changed = True
+                elif message[0] == "done":
+                    federated_failed = message[1]
+                else:
+                    search_message = message
+            if federated_changed or federated_failed is not None:
+                self.update_federated_results(federated_failed)
+            if search_message:
+                status, data, _ = search_message
                 if status == "success":
                     self.update_song_list(data)
+                    self.prefetch_neighbors(self.current_params, data)
                 elif status == "error":
-                    self.ui.song_list.delete(*self.ui.song_list.get_children())
+                    self.clear_song_list()
                     messagebox.showerror("搜索歌曲错误", data)
-        except queue.Empty:
-            pass
-
-        # handle pic queue
-        try:
-            status, data, pic_id = pic_queue.get_nowait()
-            if status == "success":
-                self.update_album_cover(data)
-            elif status == "error":
-                messagebox.showerror("搜索封面错误", data)
-        except queue.Empty:
-            pass
 
-        # handle download queue
-        try:
-            status, data = download_queue.get_nowait()
-            if status in ("success", "error"):
-                download_tasks_completed += 1
-                if download_tasks_total > 0:
-                    progress = int(download_tasks_completed * 100 / download_tasks_total)
-                    self.ui.progress_var.set(progress)
-                    self.ui.progress_task_var.set(f"{download_tasks_completed} / {download_tasks_total}")
+            # handle pic queue, only the latest cover is shown
+            pic_message = None
+            while time.perf_counter() < deadline:
+                try:
+                    pic_message = pic_queue.get_nowait()
+                except queue.Empty:
+                    break
+            if pic_message:
+                status, data, _ = pic_message
+                if status == "success":
+                    self.update_album_cover(data)
+                elif status == "error":
+                    messagebox.showerror("搜索封面错误", data)
 
+            # handle download queue, counters are updated in bulk and redrawn once
+            finished = 0
+            while time.perf_counter() < deadline:
+                try:
+                    status, data = download_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if status in ("success", "error"):
+                    finished += 1
                 if status == "error":
                     all_downloads_succeeded = False
                     error_message, retry_args = data
                     self.download_errors.append(error_message)
                     self.failed_args.append(retry_args)
 
+            if finished:
+                download_tasks_completed += finished
+                if download_tasks_total > 0:
+                    progress = int(download_tasks_completed * 100 / download_tasks_total)
+                    self.ui.progress_var.set(progress)
+                    self.ui.progress_task_var.set(f"{download_tasks_completed} / {download_tasks_total}")
                 if download_tasks_completed >= download_tasks_total:
-                    if all_downloads_succeeded:
-                        messagebox.showinfo("下载完成", "所有选中歌曲下载成功！")
-                        download_tasks_total = 0
-                    else:
-                        success_count = download_tasks_total - len(self.download_errors)
-                        error_summary = f"下载完成。成功 {success_count} 个, 失败 {len(self.download_errors)} 个。\n\n失败详情:\n"
-                        detailed_errors = "\n".join(self.download_errors)
-
-                        if messagebox.askyesno("下载完成", error_summary + detailed_errors \
-                                                           + "\n\n是否重试失败的任务？" \
-                                                           + "\n提示：\n如果下载时发生大量网络错误，请考虑减少同时下载任务数，然后重试。",
-                                               parent=self.root):
-                            self.retry_downloads()
-                        else:
-                            self.failed_args.clear()
-                            download_tasks_total = 0
-
-        except queue.Empty:
-            pass
-
-        self.root.after(100, self.process_queue)
+                    self.finish_downloads()
+
+            if download_tasks_completed < download_tasks_total:
+                # finished tracks plus the downloaded share of every track in flight
+                _, _, in_flight = metrics.transfer_progress()
+                progress = (download_tasks_completed + in_flight) * 100 / download_tasks_total
+                self.ui.progress_var.set(min(int(progress), 99))
+                eta = metrics.eta(download_tasks_total - download_tasks_completed)
+                self.ui.speed_text_var.set(f"{format_speed(metrics.bytes_per_second())} · 剩余 {format_eta(eta)}")
+                throughput = f" · {metrics.tasks_per_minute():.1f} 首/分钟"
+            else:
+                self.ui.speed_text_var.set("")
+                throughput = ""
+            self.ui.api_rate_var.set(f"{self.engine.describe()}{throughput} · API 速率: {api_limiter.describe()}")
+        finally:
+            self.processing_queue = False
+
+        if self.queue_rerun or not (search_queue.empty() and pic_queue.empty() and download_queue.empty()):
+            # budget used up, continue after Tk had a chance to handle user input
+            self.schedule_queue(1)
+        elif download_tasks_completed < download_tasks_total:
+            # keep the status line moving while downloads run
+            self.schedule_queue(QUEUE_STATUS_INTERVAL)
+
+    def schedule_queue(self, delay):
+        if self.queue_timer is not None:
+            self.root.after_cancel(self.queue_timer)
+        self.queue_timer = self.root.after(delay, self.run_queue_timer)
+
+    def run_queue_timer(self):
+        self.queue_timer = None
+        self.process_queue()
+
+    def finish_downloads(self):
+        global download_tasks_total
+        if all_downloads_succeeded:
+            messagebox.showinfo("下载完成", "所有选中歌曲下载成功！")
+            download_tasks_total = 0
+        else:
+            success_count = download_tasks_total - len(self.download_errors)
+            error_summary = f"下载完成。成功 {success_count} 个, 失败 {len(self.download_errors)} 个。\n\n失败详情:\n"
+            detailed_errors = "\n".join(self.download_errors)
+
+            if messagebox.askyesno("下载完成", error_summary + detailed_errors \
+                                               + "\n\n是否重试失败的任务？" \
+                                               + "\n提示：\n如果下载时发生大量网络错误，请考虑减少同时下载任务数，然后重试。",
+                                   parent=self.root):
+                self.retry_downloads()
+            else:
+                self.failed_args.clear()
+                download_tasks_total = 0
 
     # endregion
 
     # region download
-    def download_selected(self):
+    def download_selected(self, priority=False):
         global download_tasks_total, download_tasks_completed, all_downloads_succeeded
         items = self.ui.song_list.selection()
         if not items:
@@ -263,31 +453,35 @@ class AppCallbacks:
             self.download_errors.clear()
             self.failed_args.clear()
 
-        # Add the number of newly selected items to the total task count.
-        download_tasks_total += len(items)
-        self.ui.progress_task_var.set(f"{download_tasks_completed} / {download_tasks_total}")
-
-        bitrate = self.config.get("default_bitrate", "320")
-        cover_size = self.config.get("album_cover_size", 500)
-        lyric_mode = self.config.get("lyric_mode", "同时内嵌歌词并下载.lrc歌词文件")
-        record_type = self.config.get("record_number_type", "不编号")
-
-        id_len = len(str(abs(len(items))))
-        thread_id = 0
+        songs = []
         for item in items:
             song_id, song_name, artist, album, source, pic_id = self.ui.song_list.item(item, "values")
-            thread_str = None
-            if record_type != "不编号":
-                thread_id += 1
-                thread_str = str(thread_id).zfill(id_len)
-                if record_type == "只在元数据中编号":
-                    thread_str += "."
-                elif record_type == "只在文件名中编号":
-                    thread_str += "!"
-                elif record_type == "在元数据和文件名中编号":
-                    thread_str += "+"
-            args=(thread_str, song_id, song_name, artist, album, source, pic_id, bitrate, cover_size, lyric_mode, save_dir_music, save_dir_lyric, self.download_semaphore),
-            task_queue.put(args[0])
+            songs.append({"id": song_id, "name": song_name, "artist": artist, "album": album,
+                          "source": source, "pic_id": pic_id})
+        queued, skipped = self.engine.enqueue(songs, save_dir_music, save_dir_lyric, priority,
+                                              self.current_keyword or songs[0]["name"])
+
+        # Add the number of newly queued songs to the total task count.
+        download_tasks_total += queued
+        self.ui.progress_task_var.set(f"{download_tasks_completed} / {download_tasks_total}")
+        if skipped:
+            messagebox.showinfo("下载提示", f"{skipped} 首歌曲已在本地曲库中，已跳过")
+        self.process_queue()
+
+    def offer_resume(self):
+        """
+        ask whether to continue the downloads an earlier run left unfinished in the journal
+        """
+        global download_tasks_total
+        jobs = self.engine.unfinished_jobs()
+        if not jobs:
+            return
+        if not messagebox.askyesno("继续下载", f"上次还有 {len(jobs)} 首歌曲未下载完成，是否继续下载？", parent=self.root):
+            download_journal.discard([job_id for job_id, _, _ in jobs])
+            return
+        download_tasks_total += self.engine.resume(jobs)
+        self.ui.progress_task_var.set(f"{download_tasks_completed} / {download_tasks_total}")
+        self.process_queue()
 
     def retry_downloads(self):
         global download_tasks_total, download_tasks_completed, all_downloads_succeeded
@@ -307,9 +501,92 @@ class AppCallbacks:
         self.download_errors.clear()
         self.failed_args.clear()
 
-        # Start new threads for the failed downloads
-        for retry_args in args_to_retry:
-            task_queue.put(retry_args)
+        # queue the failed downloads again as a batch of their own
+        self.engine.requeue(args_to_retry, "重试")
+
+    def cancel_queued(self, task_ids, whole_batch=False):
+        global download_tasks_total
+        if not task_ids:
+            return
+        removed = self.engine.cancel(task_ids, whole_batch)
+        download_tasks_total -= removed
+        self.ui.progress_task_var.set(f"{download_tasks_completed} / {download_tasks_total}")
+        if removed and download_tasks_total and download_tasks_completed >= download_tasks_total:
+            self.finish_downloads()
+
+    def open_queue_window(self):
+        """
+        queued tasks in download order, with "download next", move back and cancel
+        """
+        if self.queue_window is not None and self.queue_window.winfo_exists():
+            self.queue_window.lift()
+            self.queue_window.focus_force()
+            return
+
+        win = tk.Toplevel(self.root)
+        self.queue_window = win
+        win.title("下载队列")
+        win.geometry("600x500")
+        win.minsize(400, 300)
+
+        try:
+            win.iconbitmap("assets/icon.ico")
+        except tk.TclError:
+            pass
+
+        ui_font = self.ui.ui_font
+        tree_frame = tk.Frame(win)
+        tree_frame.pack(fill="both", expand=True, padx=10, pady=(10, 5))
+        tree = ttk.Treeview(tree_frame, columns=("position", "name", "artist", "batch"), show="headings")
+        for column, text, width in (("position", "位置", 50), ("name", "歌曲", 200), ("artist", "歌手", 150),
+                                    ("batch", "批次", 150)):
+            tree.heading(column, text=text)
+            tree.column(column, width=width, anchor="w")
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        tree.pack(side="left", fill="both", expand=True)
+
+        summary_var = tk.StringVar()
+        tk.Label(win, textvariable=summary_var, font=ui_font, anchor="w").pack(fill="x", padx=10)
+
+        def selected_ids():
+            return [int(item) for item in tree.selection()]
+
+        def refresh():
+            snapshot = self.engine.queue_snapshot()
+            selection = tree.selection()
+            top = tree.yview()[0]
+            tree.delete(*tree.get_children())
+            for position, task_id, batch_name, task_args, prioritized in snapshot[:QUEUE_VIEW_ROWS]:
+                tree.insert("", "end", iid=str(task_id),
+                            values=(position, task_args[2], task_args[3], "优先下载" if prioritized else batch_name))
+            tree.selection_set([item for item in selection if tree.exists(item)])
+            tree.yview_moveto(top)
+            shown = f", 显示前 {QUEUE_VIEW_ROWS} 首" if len(snapshot) > QUEUE_VIEW_ROWS else ""
+            summary_var.set(f"排队 {len(snapshot)} 首{shown} · {self.engine.describe()}")
+
+        def refresh_loop():
+            # stops once the window is closed
+            if self.queue_window is win:
+                refresh()
+                win.after(QUEUE_VIEW_INTERVAL, refresh_loop)
+
+        button_frame = tk.Frame(win)
+        button_frame.pack(fill="x", padx=10, pady=(5, 10))
+        for text, action in (("优先下载", lambda: self.engine.prioritize(selected_ids())),
+                             ("移到批次末尾", lambda: self.engine.deprioritize(selected_ids())),
+                             ("取消所选", lambda: self.cancel_queued(selected_ids())),
+                             ("取消所在批次", lambda: self.cancel_queued(selected_ids(), True))):
+            ttk.Button(button_frame, text=text, command=lambda action=action: (action(), refresh())).pack(
+                side="left", padx=(0, 5))
+
+        def on_queue_close():
+            self.queue_window = None
+            win.destroy()
+
+        win.protocol("WM_DELETE_WINDOW", on_queue_close)
+        refresh_loop()
     # endregion
 
     def open_settings(self):
@@ -365,10 +642,16 @@ class AppCallbacks:
 
         # 默认音乐源
         tk.Label(main_frame, text="默认音乐源:", font=ui_font).pack(anchor="w", padx=10, pady=5)
-        cb_source = ttk.Combobox(main_frame, values=ALL_SOURCES, state="readonly", font=ui_font)
+        cb_source = ttk.Combobox(main_frame, values=[FEDERATED_SOURCE] + ALL_SOURCES, state="readonly", font=ui_font)
         cb_source.set(self.config.get("default_source", "netease"))
         cb_source.pack(fill="x", padx=10)
 
+        # 全部音乐源
+        tk.Label(main_frame, text="\"全部音乐源\"搜索的音乐源 (按优先级, 逗号分隔):", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        entry_federated = tk.Entry(main_frame, width=40, font=ui_font)
+        entry_federated.insert(0, ",".join(self.config.get("federated_sources", ALL_SOURCES)))
+        entry_federated.pack(fill="x", padx=10)
+
         # 默认搜索类型
         tk.Label(main_frame, text="默认搜索类型:", font=ui_font).pack(anchor="w", padx=10, pady=5)
         cb_type = ttk.Combobox(main_frame, values=["单曲/歌手搜索", "专辑搜索", "网易云歌单搜索"], state="readonly", font=ui_font)
@@ -404,6 +687,24 @@ class AppCallbacks:
         cb_concurrency.set(str(self.config.get("max_downloads", 3)))
         cb_concurrency.pack(fill="x", padx=10)
 
+        # 网络后端
+        backend_text = "下载网络后端 (重启后生效):" if aiohttp is not None else "下载网络后端 (未安装 aiohttp, 只能使用线程):"
+        tk.Label(main_frame, text=backend_text, font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_backend = ttk.Combobox(main_frame, values=NETWORK_BACKENDS, state="readonly", font=ui_font)
+        cb_backend.set(self.config.get("network_backend", NETWORK_BACKENDS[0]))
+        cb_backend.pack(fill="x", padx=10)
+
+        tk.Label(main_frame, text="asyncio 同时下载任务数:", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_async_concurrency = ttk.Combobox(main_frame, values=["16", "32", "64", "128", "256"], state="readonly", font=ui_font)
+        cb_async_concurrency.set(str(self.config.get("async_max_downloads", 32)))
+        cb_async_concurrency.pack(fill="x", padx=10)
+
+        # 全局限速
+        tk.Label(main_frame, text="全局下载限速 (KB/s, 0 为不限速):", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_bandwidth = ttk.Combobox(main_frame, values=["0", "256", "512", "1024", "2048", "5120", "10240"], font=ui_font)
+        cb_bandwidth.set(str(self.config.get("bandwidth_limit_kb", 0)))
+        cb_bandwidth.pack(fill="x", padx=10)
+
         # 单次下载编号
         tk.Label(main_frame, text="为单次下载编号:", font=ui_font).pack(anchor="w", padx=10, pady=5)
         record_number_type = ttk.Combobox(main_frame, values=["不编号", "只在元数据中编号", "只在文件名中编号", "在元数据和文件名中编号"], state="readonly", font=ui_font)
@@ -438,6 +739,92 @@ class AppCallbacks:
         cb_cover_size.set(str(self.config.get("album_cover_size", 500)))
         cb_cover_size.pack(fill="x", padx=10)
 
+        # 搜索缓存
+        tk.Label(main_frame, text="搜索结果缓存:", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_cache_mode = ttk.Combobox(main_frame, values=CACHE_MODES, state="readonly", font=ui_font)
+        cb_cache_mode.set(self.config.get("search_cache_mode", "开启"))
+        cb_cache_mode.pack(fill="x", padx=10)
+
+        tk.Label(main_frame, text="搜索缓存有效期 (分钟):", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_cache_ttl = ttk.Combobox(main_frame, values=["10", "30", "60", "360", "1440"], state="readonly", font=ui_font)
+        cb_cache_ttl.set(str(self.config.get("search_cache_ttl_minutes", 60)))
+        cb_cache_ttl.pack(fill="x", padx=10)
+
+        tk.Label(main_frame, text="搜索缓存最大条数:", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_cache_size = ttk.Combobox(main_frame, values=["50", "200", "500", "1000"], state="readonly", font=ui_font)
+        cb_cache_size.set(str(self.config.get("search_cache_max_entries", 200)))
+        cb_cache_size.pack(fill="x", padx=10)
+
+        tk.Label(main_frame, text="搜索翻页预取:", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_prefetch_mode = ttk.Combobox(main_frame, values=PREFETCH_MODES, state="readonly", font=ui_font)
+        cb_prefetch_mode.set(self.config.get("prefetch_mode", "预取下一页"))
+        cb_prefetch_mode.pack(fill="x", padx=10)
+
+        tk.Label(main_frame, text="每次运行最多预取页数:", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_prefetch_budget = ttk.Combobox(main_frame, values=["20", "50", "100", "500"], state="readonly", font=ui_font)
+        cb_prefetch_budget.set(str(self.config.get("prefetch_budget", 100)))
+        cb_prefetch_budget.pack(fill="x", padx=10)
+        tk.Label(main_frame, text=search_prefetcher.describe(), font=ui_font).pack(anchor="w", padx=10, pady=(2, 0))
+        tk.Label(main_frame, text=self.search_manager.describe(), font=ui_font).pack(anchor="w", padx=10, pady=(2, 0))
+
+        cache_stats_var = tk.StringVar(value=search_cache.describe())
+        tk.Label(main_frame, textvariable=cache_stats_var, font=ui_font).pack(anchor="w", padx=10, pady=(2, 0))
+        tk.Button(main_frame, text="清空搜索缓存", font=ui_font,
+                  command=lambda: (search_cache.clear(), cache_stats_var.set(search_cache.describe()))).pack(
+            anchor="w", padx=10, pady=(2, 5))
+
+        # 本地曲库
+        tk.Label(main_frame, text="本地曲库:", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_library_mode = ttk.Combobox(main_frame, values=LIBRARY_MODES, state="readonly", font=ui_font)
+        cb_library_mode.set(self.config.get("library_mode", LIBRARY_MODES[0]))
+        cb_library_mode.pack(fill="x", padx=10)
+
+        library_stats_var = tk.StringVar(value=f"已索引 {library_index.count()} 首")
+        tk.Label(main_frame, textvariable=library_stats_var, font=ui_font).pack(anchor="w", padx=10, pady=(2, 0))
+        tk.Button(main_frame, text="从歌曲保存路径重建曲库索引", font=ui_font,
+                  command=lambda: self.rescan_library(entry_music_path.get().strip(), library_stats_var, win)).pack(
+            anchor="w", padx=10, pady=(2, 5))
+
+        # 分段下载
+        tk.Label(main_frame, text="大文件分段下载线程数 (1 为不分段):", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_segment_count = ttk.Combobox(main_frame, values=["1", "2", "4", "6", "8"], state="readonly", font=ui_font)
+        cb_segment_count.set(str(self.config.get("segment_count", 4)))
+        cb_segment_count.pack(fill="x", padx=10)
+
+        tk.Label(main_frame, text="分段下载文件大小阈值 (MB):", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_segment_threshold = ttk.Combobox(main_frame, values=["5", "10", "20", "50", "100"], state="readonly", font=ui_font)
+        cb_segment_threshold.set(str(self.config.get("segment_threshold_mb", 20)))
+        cb_segment_threshold.pack(fill="x", padx=10)
+
+        # 磁盘写入
+        tk.Label(main_frame, text="网络读取块大小 (KB):", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_read_chunk = ttk.Combobox(main_frame, values=["8", "64", "256", "1024"], state="readonly", font=ui_font)
+        cb_read_chunk.set(str(self.config.get("read_chunk_kb", 256)))
+        cb_read_chunk.pack(fill="x", padx=10)
+
+        tk.Label(main_frame, text="磁盘写入缓冲 (KB):", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_write_buffer = ttk.Combobox(main_frame, values=["64", "256", "1024", "4096"], state="readonly", font=ui_font)
+        cb_write_buffer.set(str(self.config.get("write_buffer_kb", 1024)))
+        cb_write_buffer.pack(fill="x", padx=10)
+
+        tk.Label(main_frame, text="预分配磁盘空间:", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_preallocate = ttk.Combobox(main_frame, values=["开启", "关闭"], state="readonly", font=ui_font)
+        cb_preallocate.set(self.config.get("preallocate_mode", "开启"))
+        cb_preallocate.pack(fill="x", padx=10)
+
+        tk.Label(main_frame, text="写入同步 (fsync):", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        cb_fsync = ttk.Combobox(main_frame, values=FSYNC_MODES, state="readonly", font=ui_font)
+        cb_fsync.set(self.config.get("fsync_mode", FSYNC_MODES[0]))
+        cb_fsync.pack(fill="x", padx=10)
+
+        # 自动重试
+        tk.Label(main_frame, text="各阶段自动尝试次数 (1 为不重试):", font=ui_font).pack(anchor="w", padx=10, pady=5)
+        entry_retry = tk.Entry(main_frame, width=40, font=ui_font)
+        entry_retry.insert(0, retry_policy.describe())
+        entry_retry.pack(fill="x", padx=10)
+        # 连接池
+        tk.Label(main_frame, text=describe_pools(), font=ui_font, justify="left").pack(anchor="w", padx=10, pady=(2, 0))
+
         def on_settings_close():
             self.settings_window = None
             # _unbind_mousewheel(None)
@@ -445,19 +832,48 @@ class AppCallbacks:
 
         def save_and_close():
             self.config["default_source"] = cb_source.get()
+            federated_sources = [source.strip() for source in entry_federated.get().split(",")
+                                 if source.strip() in ALL_SOURCES]
+            self.config["federated_sources"] = federated_sources or DEFAULT_CONFIG["federated_sources"]
             self.config["default_search_type"] = cb_type.get()
             self.config["default_bitrate"] = cb_bitrate.get()
             self.config["default_search_count"] = int(cb_count.get())
             self.config["lyric_mode"] = cb_lyric_mode.get()
             self.config["max_downloads"] = int(cb_concurrency.get())
+            self.config["network_backend"] = cb_backend.get()
+            self.config["async_max_downloads"] = int(cb_async_concurrency.get())
+            bandwidth = cb_bandwidth.get().strip()
+            self.config["bandwidth_limit_kb"] = int(bandwidth) if bandwidth.isdigit() else 0
             self.config["record_number_type"] = record_number_type.get() or "不编号"
             self.config["default_music_path"] = entry_music_path.get().strip() or "每次询问"
             self.config["default_lyric_path"] = entry_lyric_path.get().strip() or "每次询问"
             self.config["album_cover_size"] = int(cb_cover_size.get())
+            self.config["segment_count"] = int(cb_segment_count.get())
+            self.config["segment_threshold_mb"] = int(cb_segment_threshold.get())
+            self.config["read_chunk_kb"] = int(cb_read_chunk.get())
+            self.config["write_buffer_kb"] = int(cb_write_buffer.get())
+            self.config["preallocate_mode"] = cb_preallocate.get()
+            self.config["fsync_mode"] = cb_fsync.get()
+            retry_attempts = dict(DEFAULT_CONFIG["retry_attempts"])
+            for item in entry_retry.get().split(","):
+                phase, _, count = item.partition(":")
+                if phase.strip() in RETRY_PHASES and count.strip().isdigit():
+                    retry_attempts[phase.strip()] = max(1, int(count))
+            self.config["retry_attempts"] = retry_attempts
+            self.config["library_mode"] = cb_library_mode.get()
+            self.config["prefetch_mode"] = cb_prefetch_mode.get()
+            self.config["prefetch_budget"] = int(cb_prefetch_budget.get())
+            self.config["search_cache_mode"] = cb_cache_mode.get()
+            self.config["search_cache_ttl_minutes"] = int(cb_cache_ttl.get())
+            self.config["search_cache_max_entries"] = int(cb_cache_size.get())
             
             save_config(self.config)
 
-            self.download_semaphore = threading.Semaphore(self.config["max_downloads"])
+            self.engine.resize(self.engine.configured_size(self.config))
+            apply_transfer_config(self.config)
+            apply_transport_config(self.config)
+            apply_cache_config(self.config)
+            apply_prefetch_config(self.config)
             self.ui.combo_source.set(self.config["default_source"])
             self.ui.combo_search_type.set(self.config["default_search_type"])
 
@@ -467,6 +883,30 @@ class AppCallbacks:
         tk.Button(main_frame, text="保存设置", font=ui_font, command=save_and_close).pack(pady=20)
         win.protocol("WM_DELETE_WINDOW", on_settings_close)
 
+    def rescan_library(self, music_dir, stats_var, win):
+        if not music_dir or music_dir == "每次询问":
+            music_dir = filedialog.askdirectory(title="选择要扫描的音乐目录", parent=win)
+            if not music_dir: return
+        if not os.path.isdir(music_dir):
+            messagebox.showerror("路径错误", f"歌曲路径\n '{music_dir}' \n不存在", parent=win)
+            return
+
+        stats_var.set("正在扫描...")
+        result = []
+        thread = threading.Thread(target=lambda: result.append(library_index.rescan(music_dir)), daemon=True)
+        thread.start()
+
+        def wait_rescan():
+            if thread.is_alive():
+                self.root.after(200, wait_rescan)
+                return
+            if not result:
+                stats_var.set("扫描失败")
+                return
+            indexed, foreign = result[0]
+            stats_var.set(f"已索引 {library_index.count()} 首 (本次扫描 {indexed} 首, {foreign} 个文件无法识别)")
+        wait_rescan()
+
     # region treeview item click
     def open_url(self, event):
         webbrowser.open("https://music.gdstudio.xyz")
@@ -498,10 +938,9 @@ class AppCallbacks:
 
     def show_album_cover(self, source, pic_id):
         cover_size = self.config.get("album_cover_size", 500)
-        params = {"types": "pic", "source": source, "id": pic_id, "size": cover_size}
         self.ui.album_label.config(image=None, text="封面加载中...")
         self.ui.album_label.image = None
-        threading.Thread(target=pic_worker, args=(params, pic_id), daemon=True).start()
+        threading.Thread(target=pic_worker, args=(source, pic_id, cover_size), daemon=True).start()
 
     def on_tree_resize(self, event):
         total_width = event.width - 20
@@ -514,7 +953,7 @@ class AppCallbacks:
             self.ui.song_list.column("专辑", width=int(remaining_width * 0.30), minwidth=120)
 
     def tree_select_all(self, event):
-        self.ui.song_list.selection_add(self.ui.song_list.get_children())
+        self.ui.song_list.selection_set(self.row_items)
         return "break"
 
     def _get_row_at_y(self,  y):
@@ -523,24 +962,25 @@ class AppCallbacks:
     def _tree_start_select(self, event):
         self.ui.song_list._rb_start_y = event.y
         self.ui.song_list._rb_start_item = self._get_row_at_y(event.y)
+        self.ui.song_list._rb_last_item = None
 
     def _tree_update_select(self, event):
         if not hasattr(self.ui.song_list, "_rb_start_y"): return
         cur_item = self._get_row_at_y(event.y)
-        if cur_item is None: return
+        if cur_item is None or cur_item == self.ui.song_list._rb_last_item: return
 
-        all_items = self.ui.song_list.get_children()
-        try:
-            from_idx = all_items.index(self.ui.song_list._rb_start_item)
-            to_idx = all_items.index(cur_item)
-        except ValueError:
+        from_idx = self.row_index.get(self.ui.song_list._rb_start_item)
+        to_idx = self.row_index.get(cur_item)
+        if from_idx is None or to_idx is None:
             return
 
+        self.ui.song_list._rb_last_item = cur_item
         first, last = min(from_idx, to_idx), max(from_idx, to_idx)
-        self.ui.song_list.selection_set(all_items[first:last + 1])
+        self.ui.song_list.selection_set(self.row_items[first:last + 1])
 
     def _tree_end_select(self, event):
         if hasattr(self.ui.song_list, "_rb_start_y"):
             del self.ui.song_list._rb_start_y
             del self.ui.song_list._rb_start_item
+            del self.ui.song_list._rb_last_item
     # endregion
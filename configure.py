@@ -5,7 +5,13 @@ import json
 import sys
 import threading
 
+from scheduler import TaskScheduler
+
 def get_user_data_dir():
+    # OBLIVIONIS_DATA_DIR keeps test / benchmark runs away from the real config and library
+    if os.getenv("OBLIVIONIS_DATA_DIR"):
+        os.makedirs(os.getenv("OBLIVIONIS_DATA_DIR"), exist_ok=True)
+        return os.getenv("OBLIVIONIS_DATA_DIR")
     if sys.platform.startswith("win"):
         base_dir = os.getenv("APPDATA")
     elif sys.platform.startswith("darwin"):
@@ -17,20 +23,71 @@ def get_user_data_dir():
     return app_dir
 
 CONFIG_FILE = os.path.join(get_user_data_dir(), "config.json")
-BASE_URL = "https://music-api.gdstudio.xyz/api.php"
+SEARCH_CACHE_FILE = os.path.join(get_user_data_dir(), "search_cache.json")
+LIBRARY_FILE = os.path.join(get_user_data_dir(), "library.db")
+JOURNAL_FILE = os.path.join(get_user_data_dir(), "journal.db")
+# processes sharing the journal refresh their ownership this often (seconds); jobs of an owner
+# silent for longer than the lease belong to a process that is gone
+JOURNAL_HEARTBEAT = 10
+JOURNAL_LEASE = 30
+COVER_CACHE_DIR = os.path.join(get_user_data_dir(), "covers")
+COVER_MEMORY_CACHE_BYTES = 32 * 1024 * 1024
+COVER_DISK_CACHE_BYTES = 256 * 1024 * 1024
+# OBLIVIONIS_API_URL points the app at another server with the same API, e.g. mock_api.py
+BASE_URL = os.getenv("OBLIVIONIS_API_URL", "https://music-api.gdstudio.xyz/api.php")
 
 ALL_SOURCES = [
     "netease", "tencent", "tidal", "spotify", "ytmusic", "qobuz", "joox",
     "deezer", "migu", "kugou", "kuwo", "ximalaya", "apple"
 ]
+# search option that fans a search out to every source in "federated_sources"
+FEDERATED_SOURCE = "全部音乐源"
+FEDERATED_TIMEOUT = 8  # seconds per source
 BITRATES = ["128", "192", "320", "740", "999"]
-DOWNLOAD_INTERVAL = 5.1
+# unfinished downloads are kept as <music_file>.part and resumed on retry
+PART_SUFFIX = ".part"
+SEGMENTS_SUFFIX = ".segments"
+
+# searches submitted closer together than this (seconds) are coalesced
+SEARCH_DEBOUNCE = 0.3
+
+# search pages prefetched but not yet shown
+PREFETCH_MAX_ENTRIES = 4
+PREFETCH_MODES = ["关闭", "预取下一页", "预取上一页和下一页"]
+
+# adaptive rate limit for BASE_URL (requests per second)
+API_RATE_INITIAL = 1.0
+API_RATE_MIN = 0.1
+API_RATE_MAX = 10.0
+
+# automatic retry of a failed download phase, backoff base * 2^attempt seconds with jitter, capped
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 8.0
+
+# download engines: one thread per track, or coroutines on one event loop (needs aiohttp)
+NETWORK_BACKENDS = ["线程 (requests)", "asyncio (aiohttp)"]
+ASYNC_CONNECTION_LIMIT = 100
+
+class NotifyingQueue(queue.Queue):
+    """
+    Queue that calls every function in `listeners` after a put,
+    lets the UI wake up on new messages instead of polling
+    """
+    def __init__(self):
+        super().__init__()
+        self.listeners = []
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        for listener in self.listeners:
+            listener()
 
 # 线程/队列
-search_queue = queue.Queue()
-pic_queue    = queue.Queue()
-download_queue = queue.Queue()
-task_queue = queue.Queue()
+search_queue = NotifyingQueue()
+pic_queue    = NotifyingQueue()
+download_queue = NotifyingQueue()
+# download tasks, per-batch queues served round-robin
+task_queue = TaskScheduler()
 
 # download counter
 search_id_counter = 0
@@ -38,15 +95,14 @@ download_tasks_total = 0
 download_tasks_completed = 0
 all_downloads_succeeded = True
 
-# speed cal
-# total_bytes_downloaded = 0
-# download_bytes_lock = threading.Lock()
-# CAL_SPEED_INTERVAL = 1
-
-session = requests.Session()
 
 # UI 常量
 settings_window = None
+QUEUE_DRAIN_BUDGET = 0.05  # seconds of queue handling per UI run
+QUEUE_STATUS_INTERVAL = 500  # ms between status refreshes while downloading
+SONG_LIST_CHUNK = 200  # rows inserted into the song list per UI run
+QUEUE_VIEW_ROWS = 500  # queued tasks listed in the download queue window
+QUEUE_VIEW_INTERVAL = 1000  # ms between refreshes of the download queue window
 FIXED_UI_FONT_SIZE = 10
 UI_FONT_FAMILY = "Segoe UI"
 MAX_COVER_SIZE = 210
@@ -62,7 +118,24 @@ DEFAULT_CONFIG = {
     "record_number_type": "不编号",
     "default_music_path": "每次询问",
     "default_lyric_path": "每次询问",
-    "album_cover_size": 500
+    "album_cover_size": 500,
+    "segment_count": 4,
+    "segment_threshold_mb": 20,
+    "search_cache_mode": "开启",
+    "search_cache_ttl_minutes": 60,
+    "search_cache_max_entries": 200,
+    "library_mode": "跳过已下载 (低音质时重新下载)",
+    "prefetch_mode": "预取下一页",
+    "prefetch_budget": 100,
+    "federated_sources": ["netease", "kuwo", "joox", "tencent", "kugou", "migu"],
+    "network_backend": "线程 (requests)",
+    "async_max_downloads": 32,
+    "bandwidth_limit_kb": 0,
+    "read_chunk_kb": 256,
+    "write_buffer_kb": 1024,
+    "fsync_mode": "不同步",
+    "preallocate_mode": "开启",
+    "retry_attempts": {"resolve": 3, "transfer": 4, "lyric": 2, "cover": 2, "tag": 2}
 }
 
 def load_config():
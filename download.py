@@ -1,215 +1,480 @@
 import re
+import time
+from contextlib import contextmanager
 from urllib.parse import urlparse
-from collections import defaultdict
-from mutagen.easyid3 import EasyID3  # For MP3 simple tags
-from mutagen.id3 import ID3, APIC, USLT  # For MP3 advanced (artwork, lyrics)
+from concurrent.futures import ThreadPoolExecutor
+from mutagen.id3 import ID3, ID3NoHeaderError, TIT2, TPE1, TALB, TRCK, TXXX, APIC, USLT  # For MP3
 from mutagen.flac import FLAC, Picture  # For FLAC
 from mutagen import MutagenError
 
-from configure import *
+from api import *
+from lyrics import merge_lyrics
+from metrics import Metrics, MetricsServer, format_speed, format_eta
+from ratelimit import BandwidthGovernor
+from writer import PartWriter, FSYNC_MODES, preallocate, written_size, discard_progress
+from retry import RetryPolicy, RETRY_PHASES, is_client_error
+from journal import DownloadJournal
+from library import LibraryIndex, LIBRARY_MODES, LIBRARY_TAG, make_library_key
+
+CONTENT_RANGE_REGEX = re.compile(r'bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)')
+
+library_index = LibraryIndex(LIBRARY_FILE)
+download_journal = DownloadJournal(JOURNAL_FILE, JOURNAL_HEARTBEAT, JOURNAL_LEASE)
+metrics = Metrics()
+# global download speed ceiling over every audio stream, set by apply_transfer_config()
+bandwidth_governor = BandwidthGovernor()
+# per-phase automatic retries of download_worker, budgets set by apply_transfer_config()
+retry_policy = RetryPolicy(DEFAULT_CONFIG["retry_attempts"], RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX, metrics.record_retry)
+
+# spare bytes left in the ID3 / FLAC header when tags have to grow it
+TAG_PADDING = 64 * 1024
+
+# segmented download and disk write settings, updated by apply_transfer_config()
+transfer_options = {
+    "segment_count": DEFAULT_CONFIG["segment_count"],
+    "segment_threshold": DEFAULT_CONFIG["segment_threshold_mb"] * 1024 * 1024,
+    "read_chunk": DEFAULT_CONFIG["read_chunk_kb"] * 1024,
+    "write_buffer": DEFAULT_CONFIG["write_buffer_kb"] * 1024,
+    "fsync_mode": DEFAULT_CONFIG["fsync_mode"],
+    "preallocate": True,
+}
+
+def apply_transfer_config(config):
+    transfer_options["segment_count"] = int(config.get("segment_count", DEFAULT_CONFIG["segment_count"]))
+    transfer_options["segment_threshold"] = int(config.get("segment_threshold_mb", DEFAULT_CONFIG["segment_threshold_mb"])) * 1024 * 1024
+    transfer_options["read_chunk"] = int(config.get("read_chunk_kb", DEFAULT_CONFIG["read_chunk_kb"])) * 1024
+    transfer_options["write_buffer"] = int(config.get("write_buffer_kb", DEFAULT_CONFIG["write_buffer_kb"])) * 1024
+    transfer_options["fsync_mode"] = config.get("fsync_mode", DEFAULT_CONFIG["fsync_mode"])
+    transfer_options["preallocate"] = config.get("preallocate_mode", DEFAULT_CONFIG["preallocate_mode"]) == "开启"
+    retry_policy.set_attempts({**DEFAULT_CONFIG["retry_attempts"], **config.get("retry_attempts", {})})
+    bandwidth_governor.set_rate(int(config.get("bandwidth_limit_kb", DEFAULT_CONFIG["bandwidth_limit_kb"])) * 1024)
+
+def parse_content_range(value):
+    """
+    'bytes 100-199/1000' -> (100, 1000), 'bytes */1000' -> (None, 1000)
+    total is None when the server sends '*'
+    """
+    match = CONTENT_RANGE_REGEX.match(value or "")
+    if not match:
+        return None, None
+    start, total = match.groups()
+    return (int(start) if start else None), (int(total) if total != "*" else None)
 
-def merge_lyrics(original_lrc, translated_lrc):
+def open_part_writer(part_file, start, total, mode="r+b", truncate=True, on_checkpoint=None):
     """
-    Merge original and translated lyrics
+    PartWriter with the configured buffer, fsync policy and preallocation
     """
-    lyric_dict = defaultdict(list)
+    return PartWriter(part_file, start, total, mode, transfer_options["write_buffer"], transfer_options["fsync_mode"],
+                      transfer_options["preallocate"], truncate, on_checkpoint)
 
-    # Capture timestamp and text. Handles both [mm:ss.xx] and [mm:ss:xx]
-    lrc_line_regex = re.compile(r'(\[\d{2}:\d{2}[.:]\d{2,3}\])(.*)')
+def fetch_audio(music_url, music_file):
+    """
+    Stream music_url into music_file + ".part", resuming with a Range request from
+    the bytes already written (written_size, not the size of a preallocated file).
+    The .part file is renamed to music_file only after its size matches the expected length.
+    A new download above segment_threshold from a server that accepts ranges goes to fetch_segmented.
+    """
+    part_file = music_file + PART_SUFFIX
+    if os.path.exists(part_file + SEGMENTS_SUFFIX):
+        # an unfinished segmented download, the .part is sparse and can only be resumed per segment
+        return fetch_segmented(music_url, music_file, None)
+
+    offset = written_size(part_file)
+    headers = {"Range": f"bytes={offset}-"} if offset else None
+
+    with media_session.get(music_url, stream=True, timeout=30, headers=headers) as r:
+        if r.status_code == 416:
+            # nothing left to fetch, or the .part is not a prefix of this file anymore
+            _, total = parse_content_range(r.headers.get("Content-Range"))
+            if total is not None and total == offset == os.path.getsize(part_file):
+                discard_progress(part_file)
+                os.replace(part_file, music_file)
+                return
+            discard_progress(part_file)
+            os.remove(part_file)
+            return fetch_audio(music_url, music_file)
+        r.raise_for_status()
+
+        if r.status_code == 206:
+            start, total = parse_content_range(r.headers.get("Content-Range"))
+            start = start or 0
+            mode = "r+b"
+        else:
+            # server ignored the Range header, start over
+            start, mode = 0, "wb"
+            total = int(r.headers["Content-Length"]) if "Content-Length" in r.headers else None
+            if (transfer_options["segment_count"] > 1 and total is not None
+                    and total >= transfer_options["segment_threshold"] and r.headers.get("Accept-Ranges") == "bytes"):
+                # large enough to split, drop this stream for parallel ranges (no extra request for small files)
+                r.close()
+                return fetch_segmented(music_url, music_file, total)
+
+        metrics.begin_transfer(music_file, start, total)
+        with open_part_writer(part_file, start, total, mode) as writer:
+            for chunk in r.iter_content(chunk_size=transfer_options["read_chunk"]):
+                writer.write(chunk)
+                metrics.add_bytes(len(chunk), music_file)
+                bandwidth_governor.consume(len(chunk))
+
+    size = os.path.getsize(part_file)
+    if total is not None and size != total:
+        raise requests.exceptions.ContentDecodingError(f"文件不完整 ({size} / {total} 字节)，重试时将断点续传")
+    os.replace(part_file, music_file)
+
+def fetch_segmented(music_url, music_file, total):
+    """
+    Fetch N byte ranges of music_url concurrently into a preallocated .part file.
+    Progress of every segment is kept in <part>.segments, written before the .part is created
+    and at every writer checkpoint, so a retry or the next run only fetches the missing bytes
+    of each segment. A segmented .part is never trusted without it.
+    total=None resumes from the saved segment list.
+    """
+    part_file = music_file + PART_SUFFIX
+    state_file = part_file + SEGMENTS_SUFFIX
+    segments = None
+    if os.path.exists(state_file):
+        try:
+            with open(state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if os.path.exists(part_file) and (total is None or state["total"] == total):
+                total, segments = state["total"], state["segments"]
+        except (IOError, ValueError, KeyError):
+            pass
+        if segments is None:
+            # unreadable state, start the whole file over
+            os.remove(state_file)
+            if os.path.exists(part_file):
+                os.remove(part_file)
+            return fetch_audio(music_url, music_file)
+
+    state_lock = threading.Lock()
+
+    def save_state():
+        tmp_file = state_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"total": total, "segments": segments}, f)
+        os.replace(tmp_file, state_file)
+
+    if segments is None:
+        count = max(1, transfer_options["segment_count"])
+        size = -(-total // count)
+        # [start, end (inclusive), bytes written]
+        segments = [[start, min(start + size, total) - 1, 0] for start in range(0, total, size)]
+        save_state()
+        with open(part_file, "wb") as f:
+            f.truncate(total)
+            if transfer_options["preallocate"]:
+                preallocate(f.fileno(), 0, total)
+    metrics.begin_transfer(music_file, sum(done for _, _, done in segments), total)
+
+    def fetch_segment(segment):
+        start, end, done = segment
+        if start + done > end:
+            return
+        headers = {"Range": f"bytes={start + done}-{end}"}
+        def checkpoint(position):
+            with state_lock:
+                segment[2] = position - start
+                save_state()
 
-    # Process original lyrics
-    for line in original_lrc.splitlines():
-        match = lrc_line_regex.match(line)
-        if match:
-            timestamp, text = match.groups()
-            lyric_dict[timestamp].append(text.strip())
+        with media_session.get(music_url, stream=True, timeout=30, headers=headers) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise requests.exceptions.ContentDecodingError("服务器不再支持分段下载")
+            with open_part_writer(part_file, start + done, None, truncate=False, on_checkpoint=checkpoint) as writer:
+                for chunk in r.iter_content(chunk_size=transfer_options["read_chunk"]):
+                    chunk = chunk[:end + 1 - writer.position]
+                    writer.write(chunk)
+                    metrics.add_bytes(len(chunk), music_file)
+                    bandwidth_governor.consume(len(chunk))
+
+    error = None
+    with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        for future in [executor.submit(fetch_segment, segment) for segment in segments]:
+            try:
+                future.result()
+            except Exception as e:
+                error = error or e
+
+    if error is not None or sum(done for _, _, done in segments) != total:
+        if error is not None:
+            raise error
+        raise requests.exceptions.ContentDecodingError("分段下载不完整，重试时将断点续传")
+
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    os.replace(part_file, music_file)
+
+# lyric / cover lookups of every track run here, next to the audio transfer
+metadata_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="metadata")
+
+class PhaseTimer:
+    """
+    wall-clock seconds spent in each phase of one track
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
 
-    # Process translated lyrics
-    for line in translated_lrc.splitlines():
-        match = lrc_line_regex.match(line)
-        if match:
-            timestamp, text = match.groups()
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
 
-            if timestamp in lyric_dict:
-                lyric_dict[timestamp].append(text.strip())
-            else:
-                lyric_dict[timestamp].insert(0, "")
-                lyric_dict[timestamp].append(text.strip())
+    def timed(self, name, func, *args):
+        with self.phase(name):
+            return func(*args)
 
-    # rebuild LRC
-    merged_lines = []
-    for timestamp, texts in sorted(lyric_dict.items()):
-        if len(texts) == 1:
-            # only one LRC
-            merged_lines.append(f"{timestamp}{texts[0]}")
-        elif len(texts) > 1:
-            # bilingual LRC
-            merged_lines.append(f"{timestamp}{texts[0]}")
-            merged_lines.append(f"{timestamp}{texts[1]}")
+    def finish(self):
+        self.timings["total"] = time.perf_counter() - self.started
+        return self.timings
 
-    return "\n".join(merged_lines)
+def format_timings(timings):
+    return " ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
 
+def fetch_lyric(source, song_id):
+    """
+    lyric text, original and translation merged when both exist
+    """
+    lyric_params = {"types": "lyric", "source": source, "id": song_id}
+    return lyric_from_data(api_get(lyric_params, timeout=15))
+
+def lyric_from_data(lyric_data):
+    original_lyric = lyric_data.get("lyric")
+    translated_lyric = lyric_data.get("tlyric")
+
+    if original_lyric and translated_lyric:
+        return merge_lyrics(original_lyric, translated_lyric)
+    elif original_lyric:
+        return original_lyric
+    elif translated_lyric:
+        return translated_lyric
+    return ""
+
+def tag_padding(info):
+    """
+    keep the header in place when the new tags fit in the existing padding,
+    otherwise grow it once with TAG_PADDING to spare for later edits
+    """
+    return info.padding if info.padding >= 0 else TAG_PADDING
 
-def download_worker(thread_str, song_id, song_name, artist, album, source, pic_id, bitrate, cover_size, lyric_mode, save_dir_music, save_dir_lyric, semaphore):
+def embed_metadata(music_file, ext, thread_str, song_name, artist, album, cover_size, lyric_mode, final_lyric_content, cover_data, library_key=None):
     """
-    download thread
+    Write tags, cover and lyric into the downloaded file in a single save:
+    every frame is composed in memory first, so the header is rewritten at most once.
+    library_key is stored so that LibraryIndex.rescan can map the file back to its API entry.
     """
-    semaphore.acquire()
+    artist = artist if isinstance(artist, str) else ' / '.join(artist)  # Handle list or string
+    track_number = thread_str[:-1] if thread_str and (thread_str[-1] == "." or thread_str[-1] == "+") else None
+    embed_lyric = final_lyric_content and lyric_mode in ["只内嵌歌词", "同时内嵌歌词并下载.lrc歌词文件"]
+
+    if ext == ".mp3":
+        try:
+            audio = ID3(music_file)
+        except ID3NoHeaderError:
+            audio = ID3()
+        audio.setall("TIT2", [TIT2(encoding=3, text=song_name)])
+        audio.setall("TPE1", [TPE1(encoding=3, text=artist)])
+        audio.setall("TALB", [TALB(encoding=3, text=album)])
+        if track_number:
+            audio.setall("TRCK", [TRCK(encoding=3, text=track_number)])
+        if library_key:
+            audio.add(TXXX(encoding=3, desc=LIBRARY_TAG, text=library_key))
+        if cover_data:
+            audio.add(APIC(
+                encoding=3,  # UTF-8
+                mime='image/jpeg',  # Assume JPEG
+                type=3,  # Cover (front)
+                desc='Cover',
+                data=cover_data
+            ))
+        if embed_lyric:
+            # plain_lyrics = '\n'.join(line.split(']', 1)[-1].strip() for line in final_lyric_content.splitlines() if ']' in line)
+            # audio.add(USLT(encoding=3, lang='eng', desc='Lyrics', text=plain_lyrics))
+            audio.add(USLT(encoding=3, desc='Lyrics', text=final_lyric_content))
+        audio.save(music_file, padding=tag_padding)
+
+    elif ext == ".flac":
+        audio = FLAC(music_file)
+        audio['title'] = song_name
+        audio['artist'] = artist
+        audio['album'] = album
+        if track_number:
+            audio['tracknumber'] = track_number
+        if library_key:
+            audio[LIBRARY_TAG.lower()] = library_key
+
+        if cover_data:
+            picture = Picture()
+            picture.data = cover_data
+            picture.type = 3  # Cover (front)
+            picture.mime = 'image/jpeg'  # Assume JPEG
+            picture.width = cover_size
+            picture.height = cover_size
+            picture.depth = 24
+            # replace instead of stacking a second cover when a file is tagged again
+            audio.clear_pictures()
+            audio.add_picture(picture)
+
+        if embed_lyric:
+            # plain_lyrics = '\n'.join(line.split(']', 1)[-1].strip() for line in final_lyric_content.splitlines() if ']' in line)
+            # audio['lyrics'] = plain_lyrics
+            audio['lyrics'] = final_lyric_content
+
+        audio.save(padding=tag_padding)
+
+def url_extension(music_url):
     try:
-        global all_downloads_succeeded
+        ext = os.path.splitext(urlparse(music_url).path)[1].lower()
+    except Exception:
+        return '.mp3'
+    return ext if ext in ['.mp3', '.flac'] else '.mp3'
+
+def track_paths(thread_str, song_name, artist, album, br, ext, save_dir_music, save_dir_lyric):
+    """
+    (music file, .lrc file or None), numbered in the file name for the "!" and "+" modes
+    """
+    if thread_str and (thread_str[-1] == "!" or thread_str[-1] == "+"):
+        base_name = f"{thread_str[:-1]}.{song_name}_{artist}_{album}_{br}kbps"
+    else:
+        base_name = f"{song_name}_{artist}_{album}_{br}kbps"
+    music_file = os.path.join(save_dir_music, sanitize_filename(base_name + ext))
+    lyric_file = os.path.join(save_dir_lyric, sanitize_filename(base_name + ".lrc")) if save_dir_lyric else None
+    return music_file, lyric_file
+
+def save_track(music_file, lyric_file, ext, thread_str, song_name, artist, album, source, song_id, bitrate,
+               requested_bitrate, cover_size, lyric_mode, final_lyric_content, cover_data):
+    """
+    everything after the transfer: .lrc file, tags, library index.
+    bitrate is the one the server delivered (music_data "br"), which may be lower than requested_bitrate
+    """
+    # 保存 .lrc 文件（模式 3 & 4）
+    if final_lyric_content and lyric_mode in ["只下载.lrc歌词文件", "同时内嵌歌词并下载.lrc歌词文件"] and lyric_file:
+        with open(lyric_file, "w", encoding="utf-8") as f:
+            f.write(final_lyric_content)
+
+    embed_metadata(music_file, ext, thread_str, song_name, artist, album, cover_size, lyric_mode,
+                   final_lyric_content, cover_data, make_library_key(source, song_id, bitrate))
+    library_index.record(source, song_id, bitrate, music_file, requested=requested_bitrate)
+
+def download_error_message(e, song_name):
+    if isinstance(e, requests.exceptions.Timeout):
+        return f"'{song_name}' \n下载时连接超时"
+    if isinstance(e, requests.exceptions.RequestException):
+        return f"'{song_name}' \n下载时发生网络错误: {e}"
+    if isinstance(e, MutagenError):
+        return f"'{song_name}' \n元数据写入失败: {e}"
+    return f"'{song_name}' \n下载时发生未知错误: {e}"
+
+def journaled_phases(job_id):
+    """
+    (music data, completed phases) an earlier run of this journal job left behind, (None, set()) to start over
+    """
+    job = download_journal.get(job_id)
+    if job is None or not job["music_url"]:
+        return None, set()
+    return {"url": job["music_url"], "br": job["bitrate"]}, job["phases"]
+
+def download_worker(thread_str, song_id, song_name, artist, album, source, pic_id, bitrate, cover_size, lyric_mode, save_dir_music, save_dir_lyric, job_id=None):
+    """
+    download a single track, run by the engine's worker pool.
+    Lyric and cover lookups don't depend on the audio, they run on metadata_executor
+    while the audio streams; tagging waits for all three.
+    Every phase is retried on its own by retry_policy, so a failed tag write keeps the
+    finished audio and a broken transfer resumes from its .part file.
+    Progress is written to download_journal under job_id; a resumed job reuses the
+    resolved url and skips a transfer that already completed. A journaled url the media
+    server rejects with a 4xx (signed urls expire) is resolved again in the same attempt.
+    """
+    global all_downloads_succeeded
+    timer = PhaseTimer()
+    lyric_future = None
+    cover_future = None
+    music_file = None
+    done_phases = set()
+    retry_args = (thread_str, song_id, song_name, artist, album, source, pic_id, bitrate, cover_size, lyric_mode,
+                  save_dir_music, save_dir_lyric, job_id)
+
+    try:
+        download_journal.started(job_id)
+        music_data, done_phases = journaled_phases(job_id)
         url_params = {
             "types": "url",
             "source": source,
             "id": song_id,
             "br": bitrate
         }
-        music_data = session.get(BASE_URL, params=url_params, timeout=15).json()
-        music_url = music_data.get("url")
-        if not music_url:
-            download_queue.put(("error", f"未能获取歌曲\n '{song_name}' \n的下载链接"))
-            all_downloads_succeeded = False
-            return
-
-        # download music
-        try:
-            parsed_url = urlparse(music_url)
-            _, ext = os.path.splitext(parsed_url.path)
-            ext = ext.lower()
-
-            if ext not in ['.mp3', '.flac']:
-                ext = '.mp3'
-        except Exception:
-            ext = '.mp3'
-
-        br = music_data.get("br", 0)
-        if thread_str and (thread_str[-1] == "!" or thread_str[-1] == "+"):
-            music_file = os.path.join(save_dir_music, sanitize_filename(f"{thread_str[:-1]}.{song_name}_{artist}_{album}_{br}kbps{ext}"))
-        else:
-            music_file = os.path.join(save_dir_music, sanitize_filename(f"{song_name}_{artist}_{album}_{br}kbps{ext}"))
-
-        with session.get(music_url, stream=True, timeout=30) as r:
-            r.raise_for_status()
-            with open(music_file, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-                    # with download_bytes_lock:
-                    #     total_bytes_downloaded += len(chunk)
-
-        # lyric handling
-        final_lyric_content = ""
-
-        if lyric_mode != "不下载歌词":
-            lyric_params = {"types": "lyric", "source": source, "id": song_id}
-            lyric_data = session.get(BASE_URL, params=lyric_params, timeout=15).json()
-
-            original_lyric = lyric_data.get("lyric")
-            translated_lyric = lyric_data.get("tlyric")
-
-            if original_lyric and translated_lyric:
-                final_lyric_content = merge_lyrics(original_lyric, translated_lyric)
-            elif original_lyric:
-                final_lyric_content = original_lyric
-            elif translated_lyric:
-                final_lyric_content = translated_lyric
-
-            # 保存 .lrc 文件（模式 3 & 4）
-            if final_lyric_content and lyric_mode in ["只下载.lrc歌词文件", "同时内嵌歌词并下载.lrc歌词文件"] and save_dir_lyric:
-                if thread_str and (thread_str[-1] == "!" or thread_str[-1] == "+"):
-                        lyric_file = os.path.join(save_dir_lyric, sanitize_filename(f"{thread_str[:-1]}.{song_name}_{artist}_{album}_{br}kbps.lrc"))
-                else:
-                    lyric_file = os.path.join(save_dir_lyric, sanitize_filename(f"{song_name}_{artist}_{album}_{br}kbps.lrc"))
-                with open(lyric_file, "w", encoding="utf-8") as f:
-                    f.write(final_lyric_content)
-
-        # download album cover with custom size
-        cover_data = None
-        if pic_id:
-            pic_params = {"types": "pic", "source": source, "id": pic_id, "size": cover_size}
-            pic_resp = session.get(BASE_URL, params=pic_params, timeout=15).json()
-            pic_url = pic_resp.get("url")
-            if pic_url:
-                cover_resp = session.get(pic_url, timeout=15)
-                cover_resp.raise_for_status()
-                cover_data = cover_resp.content
-
-        # embed metadata
-        if ext == ".mp3":
-            # Use EasyID3 for basic tags
-            audio = EasyID3(music_file)
-            audio['title'] = song_name
-            audio['artist'] = artist if isinstance(artist, str) else ' / '.join(artist)  # Handle list or string
-            audio['album'] = album
-            if thread_str and (thread_str[-1] == "." or thread_str[-1] == "+"):
-                audio['tracknumber'] = thread_str[:-1]
-            audio.save()
-
-            # Advanced: Embed artwork and lyrics using full ID3
-            audio = ID3(music_file)
-            if cover_data:
-                audio.add(APIC(
-                    encoding=3,  # UTF-8
-                    mime='image/jpeg',  # Assume JPEG
-                    type=3,  # Cover (front)
-                    desc='Cover',
-                    data=cover_data
-                ))
-            if final_lyric_content and lyric_mode in ["只内嵌歌词", "同时内嵌歌词并下载.lrc歌词文件"]:
-                # plain_lyrics = '\n'.join(line.split(']', 1)[-1].strip() for line in final_lyric_content.splitlines() if ']' in line)
-                # audio.add(USLT(encoding=3, lang='eng', desc='Lyrics', text=plain_lyrics))
-                audio.add(USLT(encoding=3, desc='Lyrics', text=final_lyric_content))
-            audio.save()
-
-        elif ext == ".flac":
-            audio = FLAC(music_file)
-            audio['title'] = song_name
-            audio['artist'] = artist if isinstance(artist, str) else ' / '.join(artist)
-            audio['album'] = album
-            if thread_str and (thread_str[-1] == "." or thread_str[-1] == "+"):
-                audio['tracknumber'] = thread_str[:-1]
-
-            if cover_data:
-                picture = Picture()
-                picture.data = cover_data
-                picture.type = 3  # Cover (front)
-                picture.mime = 'image/jpeg'  # Assume JPEG
-                picture.width = cover_size
-                picture.height = cover_size
-                picture.depth = 24
-                audio.add_picture(picture)
-
-            if final_lyric_content and lyric_mode in ["只内嵌歌词", "同时内嵌歌词并下载.lrc歌词文件"]:
-                # plain_lyrics = '\n'.join(line.split(']', 1)[-1].strip() for line in final_lyric_content.splitlines() if ']' in line)
-                # audio['lyrics'] = plain_lyrics
-                audio['lyrics'] = final_lyric_content
-
-            audio.save()
-
-        download_queue.put(("success", song_name))
-
-    except requests.exceptions.Timeout:
-        all_downloads_succeeded = False
-        retry_args = (thread_str, song_id, song_name, artist, album, source, pic_id, bitrate, cover_size, lyric_mode,
-                      save_dir_music, save_dir_lyric, semaphore)
+        while True:
+            if music_data is None:
+                with timer.phase("resolve"):
+                    music_data = retry_policy.call("resolve", api_get, url_params)
+            music_url = music_data.get("url")
+            if not music_url:
+                metrics.record_track(song_name, "error", timer.finish(), error="no url")
+                download_journal.finished(job_id, False, "no url")
+                download_queue.put(("error", (f"未能获取歌曲\n '{song_name}' \n的下载链接", retry_args)))
+                all_downloads_succeeded = False
+                return
+
+            # submitted after the url so they don't take rate-limit tokens from the critical path
+            if lyric_mode != "不下载歌词" and lyric_future is None:
+                lyric_future = metadata_executor.submit(timer.timed, "lyric", retry_policy.call, "lyric", fetch_lyric,
+                                                        source, song_id)
+            if pic_id and cover_future is None:
+                cover_future = metadata_executor.submit(timer.timed, "cover", retry_policy.call, "cover", get_cover,
+                                                        source, pic_id, cover_size)
+
+            ext = url_extension(music_url)
+            music_file, lyric_file = track_paths(thread_str, song_name, artist, album, music_data.get("br", 0), ext,
+                                                 save_dir_music, save_dir_lyric)
+            if "resolve" not in done_phases:
+                download_journal.resolved(job_id, music_url, music_data.get("br", 0), music_file)
+
+            if "transfer" in done_phases and os.path.exists(music_file):
+                break
+            try:
+                with timer.phase("transfer"):
+                    retry_policy.call("transfer", fetch_audio, music_url, music_file)
+            except Exception as e:
+                if "resolve" not in done_phases or not is_client_error(e):
+                    raise
+                # the url came from the journal and has expired, resolve it again
+                music_data, done_phases = None, set()
+                continue
+            download_journal.phase_done(job_id, "transfer")
+            break
+
+        # time the audio spent waiting for lyric / cover, 0 when they were already done
+        with timer.phase("wait_metadata"):
+            final_lyric_content = lyric_future.result() if lyric_future else ""
+            cover_data = cover_future.result() if cover_future else None
+
+        with timer.phase("tag"):
+            retry_policy.call("tag", save_track, music_file, lyric_file, ext, thread_str, song_name, artist, album,
+                              source, song_id, music_data.get("br") or bitrate, bitrate, cover_size, lyric_mode,
+                              final_lyric_content, cover_data)
+
+        timings = timer.finish()
+        metrics.record_track(song_name, "success", timings, os.path.getsize(music_file))
+        download_journal.finished(job_id, True)
+        download_queue.put(("success", (song_name, timings)))
 
-        download_queue.put(("error", (f"'{song_name}' \n下载时连接超时", retry_args)))
-    except requests.exceptions.RequestException as e:
-        all_downloads_succeeded = False
-        retry_args = (thread_str, song_id, song_name, artist, album, source, pic_id, bitrate, cover_size, lyric_mode,
-                      save_dir_music, save_dir_lyric, semaphore)
-
-        download_queue.put(("error", (f"'{song_name}' \n下载时发生网络错误: {e}", retry_args)))
-    except MutagenError as e:
-        all_downloads_succeeded = False
-        retry_args = (thread_str, song_id, song_name, artist, album, source, pic_id, bitrate, cover_size, lyric_mode,
-                      save_dir_music, save_dir_lyric, semaphore)
-
-        download_queue.put(("error", (f"'{song_name}' \n元数据写入失败: {e}", retry_args)))
     except Exception as e:
         all_downloads_succeeded = False
-        retry_args = (thread_str, song_id, song_name, artist, album, source, pic_id, bitrate, cover_size, lyric_mode,
-                      save_dir_music, save_dir_lyric, semaphore)
-
-        download_queue.put(("error", (f"'{song_name}' \n下载时发生未知错误: {e}", retry_args)))
+        error_message = download_error_message(e, song_name)
+        metrics.record_track(song_name, "error", timer.finish(), error=error_message.replace("\n", ""))
+        if done_phases:
+            # the journaled url may have expired, resolve again next time
+            download_journal.forget_url(job_id)
+        download_journal.finished(job_id, False, error_message.replace("\n", ""))
+        download_queue.put(("error", (error_message, retry_args)))
 
     finally:
-        semaphore.release()
+        # drop lookups that haven't started when the track failed early
+        for future in (lyric_future, cover_future):
+            if future:
+                future.cancel()
+        metrics.end_transfer(music_file)
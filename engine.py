@@ -0,0 +1,214 @@
+import threading
+
+from download import *
+from search import *
+
+class DownloadEngine:
+    """
+    GUI-free download engine. Owns a fixed-size worker pool and builds download tasks,
+    both the Tk GUI and the headless batch mode are clients of it.
+    Results are reported through download_queue.
+    """
+    def __init__(self, config=None):
+        self.config = config if config is not None else load_config()
+        self.workers = []
+        self.pool_size = 0
+        self.active_workers = 0
+        self.retire_count = 0
+        self.stopping = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        apply_transfer_config(self.config)
+        apply_transport_config(self.config)
+        self.resize(self.configured_size(self.config))
+
+    def configured_size(self, config):
+        """
+        how many tracks this engine downloads at the same time with these settings
+        """
+        return config.get("max_downloads", 3)
+
+    def worker_loop(self):
+        """
+        Pool worker: blocks on the task queue and runs tasks one by one.
+        A None task only wakes the worker up so it can retire (resize / shutdown).
+        Pacing is left to api_limiter, which throttles every call to BASE_URL.
+        """
+        while True:
+            if self._retire():
+                return
+            task_args = task_queue.get()
+            if task_args is None:
+                task_queue.task_done()
+                continue
+
+            with self.lock:
+                self.active_workers += 1
+            try:
+                download_worker(*task_args)
+            except Exception as e:
+                # download_worker reports its own failures, this only catches a failing report
+                # (e.g. the journal locked by a --batch run), so the task still ends and the thread lives on
+                download_queue.put(("error", (download_error_message(e, task_args[2]), task_args)))
+            finally:
+                with self.lock:
+                    self.active_workers -= 1
+                task_queue.task_done()
+
+    def _retire(self):
+        with self.lock:
+            if self.stopping or self.retire_count > 0:
+                if self.retire_count > 0:
+                    self.retire_count -= 1
+                self.workers.remove(threading.current_thread())
+                return True
+        return False
+
+    def resize(self, max_downloads):
+        """
+        Set the number of worker threads, i.e. how many tracks download at the same time.
+        """
+        with self.lock:
+            delta = max_downloads - self.pool_size
+            self.pool_size = max_downloads
+            if delta > 0:
+                # cancel pending retirements first
+                cancelled = min(delta, self.retire_count)
+                self.retire_count -= cancelled
+                for _ in range(delta - cancelled):
+                    worker = threading.Thread(target=self.worker_loop, daemon=True)
+                    self.workers.append(worker)
+                    worker.start()
+            else:
+                self.retire_count -= delta
+        for _ in range(-delta):
+            task_queue.put(None)
+
+    def shutdown(self, drain=True, timeout=None):
+        """
+        Stop the pool. drain=True lets queued tasks finish first,
+        drain=False drops tasks that haven't started.
+        """
+        if drain:
+            task_queue.join()
+        else:
+            try:
+                while True:
+                    task_queue.get_nowait()
+                    task_queue.task_done()
+            except queue.Empty:
+                pass
+        with self.lock:
+            self.stopping = True
+            workers = self.workers[:]
+        for _ in workers:
+            task_queue.put(None)
+        for worker in workers:
+            worker.join(timeout)
+
+    def queue_depth(self):
+        return task_queue.qsize()
+
+    def describe(self):
+        return f"队列 {self.queue_depth()} · 下载中 {self.active_workers}/{self.pool_size}"
+
+    def enqueue(self, songs, save_dir_music, save_dir_lyric, priority=False, name=""):
+        """
+        Build download tasks for a list of songs and put them into the task queue as one batch.
+        songs: dicts with id, name, artist, album, source, pic_id (search result format)
+        priority: "download next", ahead of every batch already queued
+        Songs the library index already has at this bitrate or better are skipped.
+        Returns (queued, skipped).
+        """
+        bitrate = self.config.get("default_bitrate", "320")
+        cover_size = self.config.get("album_cover_size", 500)
+        lyric_mode = self.config.get("lyric_mode", "同时内嵌歌词并下载.lrc歌词文件")
+        record_type = self.config.get("record_number_type", "不编号")
+        skip_downloaded = self.config.get("library_mode", LIBRARY_MODES[0]) != "关闭"
+
+        id_len = len(str(abs(len(songs))))
+        thread_id = 0
+        tasks = []
+        for song in songs:
+            # keep numbering by position in the selection, skipped songs included
+            thread_id += 1
+            if skip_downloaded and library_index.status(song["source"], song["id"], bitrate) == "have":
+                continue
+            thread_str = None
+            if record_type != "不编号":
+                thread_str = str(thread_id).zfill(id_len)
+                if record_type == "只在元数据中编号":
+                    thread_str += "."
+                elif record_type == "只在文件名中编号":
+                    thread_str += "!"
+                elif record_type == "在元数据和文件名中编号":
+                    thread_str += "+"
+            artist = ' / '.join(song["artist"]) if isinstance(song["artist"], list) else song["artist"]
+            tasks.append((thread_str, song["id"], song["name"], artist, song["album"], song["source"],
+                          song.get("pic_id", ""), bitrate, cover_size, lyric_mode, save_dir_music, save_dir_lyric))
+        # journaled before they are queued, so a crash can't lose a task that was accepted
+        batch = task_queue.new_batch(name)
+        for task_args, job_id in zip(tasks, download_journal.add(tasks)):
+            task_queue.put(task_args + (job_id,), batch=batch, priority=priority)
+        return len(tasks), len(songs) - len(tasks)
+
+    def requeue(self, tasks, name=""):
+        """
+        put task tuples (retry_args, journal id included) back into the queue as one batch
+        """
+        batch = task_queue.new_batch(name)
+        for task_args in tasks:
+            task_queue.put(task_args, batch=batch)
+
+    def queue_snapshot(self):
+        """
+        [(position, task_id, batch name, task args, prioritized)] of the queued tasks, in download order
+        """
+        return task_queue.snapshot()
+
+    def prioritize(self, task_ids):
+        task_queue.prioritize(task_ids)
+
+    def deprioritize(self, task_ids):
+        task_queue.deprioritize(task_ids)
+
+    def cancel(self, task_ids, whole_batch=False):
+        """
+        Remove queued tasks (or all queued tasks of their batches) and drop them from the journal.
+        Returns how many were removed.
+        """
+        removed = task_queue.cancel_batches(task_ids) if whole_batch else task_queue.cancel(task_ids)
+        download_journal.discard([task_args[12] for task_args in removed if task_args[12] is not None])
+        return len(removed)
+
+    def unfinished_jobs(self):
+        """
+        [(job_id, state, task args)] an earlier run left queued or running in the journal.
+        Jobs of processes still running (e.g. a --batch run next to the GUI) are not included.
+        Jobs that ended in earlier runs are dropped from the journal.
+        """
+        download_journal.discard()
+        return download_journal.pending()
+
+    def resume(self, jobs):
+        """
+        Put unfinished journal jobs back into the task queue, skipping tracks the library
+        already has. A job that was running when the app stopped keeps its resolved url,
+        completed phases and the bytes its .part holds.
+        Jobs are claimed for this process first; one another process resumed in the meantime is left to it.
+        Returns how many tasks were queued.
+        """
+        queued = 0
+        batch = task_queue.new_batch("上次未完成")
+        claimed = set(download_journal.claim([job_id for job_id, _, _ in jobs]))
+        for job_id, _, task_args in jobs:
+            if job_id not in claimed:
+                continue
+            _, song_id, _, _, _, source, _, bitrate = task_args[:8]
+            if library_index.status(source, song_id, bitrate) == "have":
+                download_journal.finished(job_id, True)
+                continue
+            task_queue.put(task_args + (job_id,), batch=batch)
+            queued += 1
+        return queued
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+
+class DownloadJournal:
+    """
+    SQLite journal of download jobs (queued -> running -> done / failed), written before
+    the work it describes so a closed window or a crash loses nothing: every enqueued task,
+    when it starts, the url and file its resolve phase produced, which later phases
+    completed and how it ended.
+    Jobs still queued or running are offered for resume on the next start.
+    Calls with job_id None are ignored, for tasks that were never journaled.
+
+    Several processes (the GUI, --batch runs) can share one journal. Every job belongs to
+    the process that queued or claimed it, and every process that owns jobs refreshes its
+    row in `owners` every `heartbeat` seconds. Jobs of an owner heard from within `lease`
+    seconds are live: they are neither offered for resume nor discarded by anyone else.
+    """
+    def __init__(self, path, heartbeat=10.0, lease=30.0):
+        self.path = path
+        self.heartbeat = heartbeat
+        self.lease = lease
+        # pid alone could be reused by a later process
+        self.owner = f"{os.getpid()}@{time.time():.3f}"
+        self.heartbeat_thread = None
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            # WAL + NORMAL: a commit per state change stays cheap and survives a crash of the app
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    args TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    music_url TEXT,
+                    bitrate TEXT,
+                    music_file TEXT,
+                    phases TEXT NOT NULL DEFAULT '',
+                    error TEXT,
+                    updated REAL NOT NULL,
+                    owner TEXT
+                )""")
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")]
+            if "owner" not in columns:
+                # journals written before jobs had owners, their jobs belong to nobody
+                self.conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS owners (
+                    owner TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    heartbeat REAL NOT NULL
+                )""")
+
+    def _beat(self):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO owners VALUES (?, ?, ?)", (self.owner, os.getpid(), time.time()))
+
+    def _own(self):
+        """
+        start heartbeating before this process takes its first job
+        """
+        if self.heartbeat_thread is not None:
+            return
+        self._beat()
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True, name="journal-heartbeat")
+        self.heartbeat_thread.start()
+        atexit.register(self.release)
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat)
+            try:
+                self._beat()
+            except sqlite3.Error:
+                # locked by another process for now, the lease has room for a missed beat
+                pass
+
+    def release(self):
+        """
+        give up ownership on a clean exit, so unfinished jobs are offered right away instead of after the lease
+        """
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+        except sqlite3.Error:
+            pass
+
+    def _orphaned(self):
+        """
+        SQL condition and parameters for jobs no other live process owns
+        """
+        return ("(owner IS NULL OR owner = ? OR owner NOT IN (SELECT owner FROM owners WHERE heartbeat > ?))",
+                (self.owner, time.time() - self.lease))
+
+    def add(self, tasks):
+        """
+        journal task argument tuples as queued, returns their job ids in order
+        """
+        self._own()
+        ids = []
+        with self.lock, self.conn:
+            for task_args in tasks:
+                cursor = self.conn.execute(
+                    "INSERT INTO jobs (args, state, updated, owner) VALUES (?, 'queued', ?, ?)",
+                    (json.dumps(task_args, ensure_ascii=False), time.time(), self.owner))
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def _update(self, job_id, sql, *params):
+        if job_id is None:
+            return
+        with self.lock, self.conn:
+            self.conn.execute(f"UPDATE jobs SET {sql}, updated = ? WHERE id = ?", params + (time.time(), job_id))
+
+    def started(self, job_id):
+        self._update(job_id, "state = 'running'")
+
+    def resolved(self, job_id, music_url, bitrate, music_file):
+        self._update(job_id, "music_url = ?, bitrate = ?, music_file = ?, phases = 'resolve'",
+                     music_url, str(bitrate), music_file)
+
+    def forget_url(self, job_id):
+        """
+        drop a journaled url that may have expired, the next attempt resolves again
+        """
+        self._update(job_id, "music_url = NULL, phases = ''")
+
+    def phase_done(self, job_id, phase):
+        self._update(job_id, "phases = phases || ?", "," + phase)
+
+    def finished(self, job_id, ok, error=None):
+        self._update(job_id, "state = ?, error = ?", "done" if ok else "failed", error)
+
+    def get(self, job_id):
+        """
+        {"state", "music_url", "bitrate", "music_file", "phases"} of a job, None when unknown
+        """
+        if job_id is None:
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT state, music_url, bitrate, music_file, phases FROM jobs WHERE id = ?",
+                                    (job_id,)).fetchone()
+        if row is None:
+            return None
+        state, music_url, bitrate, music_file, phases = row
+        return {"state": state, "music_url": music_url, "bitrate": bitrate, "music_file": music_file,
+                "phases": set(filter(None, phases.split(",")))}
+
+    def pending(self):
+        """
+        [(job_id, state, task args)] of jobs that were queued or running in a process that is gone, oldest first
+        """
+        orphaned, params = self._orphaned()
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, state, args FROM jobs WHERE state IN ('queued', 'running') AND owner IS NOT ? "
+                f"AND {orphaned} ORDER BY id", (self.owner,) + params).fetchall()
+        return [(job_id, state, tuple(json.loads(args))) for job_id, state, args in rows]
+
+    def claim(self, job_ids):
+        """
+        take over jobs from pending() for this process, returns the ids that weren't claimed by another one first
+        """
+        self._own()
+        orphaned, params = self._orphaned()
+        claimed = []
+        with self.lock, self.conn:
+            for job_id in job_ids:
+                cursor = self.conn.execute(f"UPDATE jobs SET owner = ?, updated = ? WHERE id = ? AND {orphaned}",
+                                           (self.owner, time.time(), job_id) + params)
+                if cursor.rowcount:
+                    claimed.append(job_id)
+        return claimed
+
+    def discard(self, job_ids=None):
+        """
+        forget the given jobs, or every job that is not queued or running.
+        Jobs of other live processes are kept.
+        """
+        orphaned, params = self._orphaned()
+        with self.lock, self.conn:
+            if job_ids is None:
+                self.conn.execute(f"DELETE FROM jobs WHERE state NOT IN ('queued', 'running') AND {orphaned}", params)
+            else:
+                self.conn.executemany(f"DELETE FROM jobs WHERE id = ? AND {orphaned}",
+                                      [(job_id,) + params for job_id in job_ids])
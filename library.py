@@ -0,0 +1,139 @@
+import os
+import time
+import sqlite3
+import threading
+
+from mutagen import MutagenError
+from mutagen.id3 import ID3
+from mutagen.flac import FLAC
+
+LIBRARY_MODES = ["跳过已下载 (低音质时重新下载)", "关闭"]
+
+# tag that ties a file back to its API entry: "<source>:<song_id>:<bitrate>"
+LIBRARY_TAG = "OBLIVIONIS"
+
+def make_library_key(source, song_id, bitrate):
+    return f"{source}:{song_id}:{bitrate}"
+
+def read_library_key(path):
+    """
+    (source, song_id, bitrate, tagged) stored in a downloaded file, None for foreign files
+    """
+    try:
+        if path.lower().endswith(".mp3"):
+            tags = ID3(path)
+            frame = tags.get(f"TXXX:{LIBRARY_TAG}")
+            key = frame.text[0] if frame else None
+            tagged = "TIT2" in tags
+        else:
+            tags = FLAC(path)
+            values = tags.get(LIBRARY_TAG.lower())
+            key = values[0] if values else None
+            tagged = "title" in tags
+    except (MutagenError, IndexError):
+        return None
+    if not key or key.count(":") < 2:
+        return None
+    source, rest = key.split(":", 1)
+    song_id, bitrate = rest.rsplit(":", 1)
+    return source, song_id, bitrate, tagged
+
+class LibraryIndex:
+    """
+    SQLite index of downloaded tracks keyed by (source, song_id, bitrate),
+    used to skip tracks that are already on disk.
+    bitrate is what the source delivered, requested what was asked for: a source that
+    caps a track below the request still counts as done for requests up to that one.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    source TEXT NOT NULL,
+                    song_id TEXT NOT NULL,
+                    bitrate TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    tagged INTEGER NOT NULL,
+                    updated REAL NOT NULL,
+                    requested TEXT,
+                    PRIMARY KEY (source, song_id, bitrate)
+                )""")
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(tracks)")]
+            if "requested" not in columns:
+                # indexes written before the requested bitrate was kept
+                self.conn.execute("ALTER TABLE tracks ADD COLUMN requested TEXT")
+
+    def record(self, source, song_id, bitrate, path, tagged=True, requested=None):
+        """
+        bitrate: delivered, requested: asked for (None when unknown, e.g. found by rescan)
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO tracks (source, song_id, bitrate, path, size, tagged, updated, requested) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, str(song_id), str(bitrate), os.path.abspath(path), os.path.getsize(path),
+                 int(tagged), time.time(), None if requested is None else str(requested)))
+
+    def lookup(self, source, song_id):
+        """
+        [(bitrate, requested, path)] of copies that are still on disk with the recorded size
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT bitrate, requested, path, size FROM tracks WHERE source = ? AND song_id = ?",
+                (source, str(song_id))).fetchall()
+        return [(bitrate, requested, path) for bitrate, requested, path, size in rows
+                if os.path.exists(path) and os.path.getsize(path) == size]
+
+    def status(self, source, song_id, bitrate):
+        """
+        "missing": never downloaded, "upgrade": only lower bitrates on disk, "have": nothing to do.
+        A copy delivered below `bitrate` still counts when it was asked for at `bitrate` or higher,
+        the source had nothing better then.
+        """
+        copies = self.lookup(source, song_id)
+        if not copies:
+            return "missing"
+        if any(int(have) >= int(bitrate) or (requested and int(requested) >= int(bitrate))
+               for have, requested, _ in copies):
+            return "have"
+        return "upgrade"
+
+    def rescan(self, music_dir):
+        """
+        Rebuild the index for music_dir from the tags of the files inside it.
+        Returns (indexed, foreign) file counts.
+        """
+        music_dir = os.path.abspath(music_dir)
+        found = []
+        foreign = 0
+        for root, _, files in os.walk(music_dir):
+            for name in files:
+                if not name.lower().endswith((".mp3", ".flac")):
+                    continue
+                path = os.path.join(root, name)
+                key = read_library_key(path)
+                if key is None:
+                    foreign += 1
+                    continue
+                source, song_id, bitrate, tagged = key
+                found.append((source, song_id, bitrate, path, os.path.getsize(path), int(tagged), time.time()))
+
+        pattern = music_dir.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + os.sep + "%"
+        with self.lock, self.conn:
+            # the tags don't carry the requested bitrate, keep what the index knew for the same file
+            requested = dict(self.conn.execute(
+                "SELECT path, requested FROM tracks WHERE path LIKE ? ESCAPE '\\'", (pattern,)).fetchall())
+            self.conn.execute("DELETE FROM tracks WHERE path LIKE ? ESCAPE '\\'", (pattern,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO tracks (source, song_id, bitrate, path, size, tagged, updated, requested) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [row + (requested.get(row[3]),) for row in found])
+        return len(found), foreign
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
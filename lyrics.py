@@ -0,0 +1,113 @@
+import re
+from bisect import bisect_left
+from operator import itemgetter
+
+# [mm:ss], [mm:ss.x], [mm:ss.xx], [mm:ss.xxx], also with ":" before the fraction
+TIMESTAMP_REGEX = re.compile(r'\[(\d+):(\d{1,2})(?:[.:](\d{1,3}))?\]')
+# first timestamp split up, further timestamps, then the text
+LINE_REGEX = re.compile(r'^[ \t]*\[(\d+):(\d{1,2})(?:[.:](\d{1,3}))?\]((?:\[\d+:\d{1,2}(?:[.:]\d{1,3})?\])*)(.*)', re.M)
+# [ar:...], [ti:...], [offset:+500] ...
+ID_TAG_REGEX = re.compile(r'^[ \t]*(\[([a-zA-Z#]+):([^\]\n]*)\])[ \t\r]*$', re.M)
+
+# a translation is paired with the nearest original line at most this far away
+ALIGN_TOLERANCE_MS = 300
+
+# fraction digits -> ms: ".5" is half a second, ".05" and ".050" are 50 ms
+FRACTION_MS = {"": 0}
+for digits in range(1, 4):
+    for value in range(10 ** digits):
+        FRACTION_MS[str(value).zfill(digits)] = value * 10 ** (3 - digits)
+
+def to_millis(minutes, seconds, fraction):
+    return (int(minutes) * 60 + int(seconds)) * 1000 + FRACTION_MS[fraction]
+
+def format_timestamp(ms):
+    return f"[{ms // 60000:02d}:{ms // 1000 % 60:02d}.{ms % 1000 // 10:02d}]"
+
+def parse_lrc(text, offset=0):
+    """
+    Parse LRC text into ([(ms, text)] sorted by time, [id tag lines], offset).
+    A line with several timestamps ("[00:12.00][00:45.00]text") yields one entry per timestamp.
+    The [offset:] tag, or `offset` when the text has none, is applied to every timestamp
+    and not returned as a tag.
+    """
+    entries = []
+    for minutes, seconds, fraction, more, lyric in LINE_REGEX.findall(text):
+        lyric = lyric.strip()
+        entries.append(((int(minutes) * 60 + int(seconds)) * 1000 + FRACTION_MS[fraction], lyric))
+        if more:
+            entries.extend((to_millis(*stamp), lyric) for stamp in TIMESTAMP_REGEX.findall(more))
+
+    tags = []
+    for match in ID_TAG_REGEX.finditer(text):
+        if match.group(2).lower() != "offset":
+            tags.append(match.group(1))
+            continue
+        try:
+            offset = int(match.group(3).strip())
+        except ValueError:
+            pass
+
+    # a positive offset makes the lyrics show up earlier
+    if offset:
+        entries = [(max(ms - offset, 0), lyric) for ms, lyric in entries]
+    entries.sort(key=itemgetter(0))
+    return entries, tags, offset
+
+def unpaired_lines(ms, lyric):
+    # empty original line first so players still show the translation as the second line
+    timestamp = format_timestamp(ms)
+    return timestamp, timestamp + lyric
+
+def merge_lyrics(original_lrc, translated_lrc, tolerance=ALIGN_TOLERANCE_MS):
+    """
+    Merge original and translated lyrics into bilingual LRC.
+    Every translation line is put under the nearest unpaired original line within `tolerance` ms,
+    using the original's timestamp; translations without a partner keep their own time.
+    """
+    original, tags, offset = parse_lrc(original_lrc)
+    # translations are timed like the original, its offset applies unless they bring their own
+    translated, _, _ = parse_lrc(translated_lrc, offset)
+
+    original_times = [ms for ms, _ in original]
+    pairs = [None] * len(original)
+    unpaired = []
+    for ms, lyric in translated:
+        if not lyric:
+            continue
+        index = bisect_left(original_times, ms)
+        best = None
+        # nearest unpaired line on either side, skipping lines that already have a translation
+        before = index - 1
+        while before >= 0 and ms - original_times[before] <= tolerance:
+            if pairs[before] is None:
+                best = before
+                break
+            before -= 1
+        after = index
+        while after < len(original) and original_times[after] - ms <= tolerance:
+            if pairs[after] is None:
+                if best is None or original_times[after] - ms < ms - original_times[best]:
+                    best = after
+                break
+            after += 1
+        if best is None:
+            unpaired.append((ms, lyric))
+        else:
+            pairs[best] = lyric
+
+    # both lists are in time order, merge them; an unpaired translation goes after
+    # the original line with the same time
+    lines = []
+    position = 0
+    for (ms, lyric), translation in zip(original, pairs):
+        while position < len(unpaired) and unpaired[position][0] < ms:
+            lines.extend(unpaired_lines(*unpaired[position]))
+            position += 1
+        timestamp = format_timestamp(ms)
+        lines.append(timestamp + lyric)
+        if translation is not None:
+            lines.append(timestamp + translation)
+    for ms, lyric in unpaired[position:]:
+        lines.extend(unpaired_lines(ms, lyric))
+    return "\n".join(tags + lines)
@@ -1,13 +1,10 @@
-import tkinter as tk
+import argparse
 import sys
-from tkinter import messagebox
-from GUI import MainUI
-from callbacks import AppCallbacks
 import os
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
 def hide_console():
     if sys.platform.startswith('win'):
+        from tkinter import messagebox
         try:
             import ctypes
             console_window = ctypes.windll.kernel32.GetConsoleWindow()
@@ -16,7 +13,35 @@ def hide_console():
         except Exception:
             messagebox.showwarning("界面提示", "无法隐藏控制台窗口")
 
-def main():
+def parse_args():
+    parser = argparse.ArgumentParser(description="Oblivionis Music Search and Downloader")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="headless mode: download every (source, id) pair / playlist listed in FILE")
+    parser.add_argument("--resume", action="store_true",
+                        help="headless mode: finish the downloads an earlier run left unfinished")
+    parser.add_argument("--music-dir", help="music save directory for batch mode (default: settings)")
+    parser.add_argument("--lyric-dir", help="lyric save directory for batch mode (default: settings)")
+    parser.add_argument("--rescan", metavar="DIR", help="rebuild the local library index from the music files in DIR")
+    parser.add_argument("--limit-kb", type=int, metavar="KB",
+                        help="batch mode: global download speed ceiling in KB/s, 0 = unlimited (default: settings)")
+    parser.add_argument("--metrics-log", metavar="FILE", help="append one JSON line per finished track to FILE")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    return parser.parse_args()
+
+def start_metrics(args):
+    from download import metrics, MetricsServer, api_limiter
+    if args.metrics_log:
+        metrics.open_log(args.metrics_log)
+    if args.metrics_port:
+        MetricsServer(metrics, args.metrics_port, lambda: {"api_requests_per_second": round(api_limiter.rate, 3)})
+
+def run_gui():
+    import tkinter as tk
+    from GUI import MainUI
+    from callbacks import AppCallbacks
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
     hide_console()
 
     root = tk.Tk()
@@ -38,5 +63,33 @@ def main():
     callbacks.process_queue()
     root.mainloop()
 
+def main():
+    args = parse_args()
+    if args.rescan:
+        from download import library_index
+        indexed, foreign = library_index.rescan(args.rescan)
+        print(f"已索引 {indexed} 首, {foreign} 个文件无法识别 (曲库共 {library_index.count()} 首)")
+        return
+
+    if args.metrics_log or args.metrics_port:
+        start_metrics(args)
+
+    if args.batch or args.resume:
+        from batch import run_batch, resume_batch, load_config
+        config = load_config()
+        if args.limit_kb is not None:
+            config["bandwidth_limit_kb"] = args.limit_kb
+        try:
+            if args.resume:
+                failed = resume_batch(config)
+            else:
+                failed = run_batch(args.batch, args.music_dir, args.lyric_dir, config)
+        except (OSError, ValueError) as e:
+            print(f"批量下载失败: {e}", file=sys.stderr)
+            sys.exit(2)
+        sys.exit(1 if failed else 0)
+
+    run_gui()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,219 @@
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# per-phase samples kept for the quantiles
+PHASE_SAMPLES = 1000
+# seconds of history behind bytes/s and tasks/min
+RATE_WINDOW = 5
+TASK_WINDOW = 60
+
+class Metrics:
+    """
+    Download instrumentation: transferred bytes, finished tracks and per-phase timings.
+    Rates are taken over a sliding window, finished tracks can also be appended to a JSON lines file.
+    Transfers in flight are tracked per key (the music file) in bytes, for progress and ETA.
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self.bytes_total = 0
+        self.byte_buckets = deque()  # [second, bytes]
+        self.finished = deque()  # monotonic time of finished tracks within TASK_WINDOW
+        self.tracks = {"success": 0, "error": 0}
+        self.retries = {}  # phase -> automatic retries
+        self.phases = {}  # phase -> [count, sum, deque of recent samples]
+        self.transfers = {}  # key -> [bytes done, expected bytes or None]
+        self.sized_tracks = 0
+        self.sized_bytes = 0
+        self.log_file = None
+        self.lock = threading.Lock()
+
+    def open_log(self, path):
+        """
+        append one JSON object per finished track to path, None to stop
+        """
+        with self.lock:
+            if self.log_file is not None:
+                self.log_file.close()
+            self.log_file = open(path, "a", encoding="utf-8") if path else None
+
+    def begin_transfer(self, key, done, total):
+        """
+        a transfer of `total` bytes (None when unknown) starts with `done` bytes already on disk
+        """
+        with self.lock:
+            self.transfers[key] = [done, total]
+
+    def end_transfer(self, key):
+        with self.lock:
+            self.transfers.pop(key, None)
+
+    def add_bytes(self, count, key=None):
+        second = int(time.monotonic())
+        with self.lock:
+            self.bytes_total += count
+            transfer = self.transfers.get(key)
+            if transfer is not None:
+                transfer[0] += count
+            if self.byte_buckets and self.byte_buckets[-1][0] == second:
+                self.byte_buckets[-1][1] += count
+            else:
+                self.byte_buckets.append([second, count])
+                while self.byte_buckets[0][0] <= second - RATE_WINDOW:
+                    self.byte_buckets.popleft()
+
+    def record_track(self, song_name, status, timings, size=None, error=None):
+        now = time.monotonic()
+        with self.lock:
+            self.tracks[status] += 1
+            self.finished.append(now)
+            if size:
+                self.sized_tracks += 1
+                self.sized_bytes += size
+            for phase, seconds in timings.items():
+                entry = self.phases.setdefault(phase, [0, 0.0, deque(maxlen=PHASE_SAMPLES)])
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2].append(seconds)
+            if self.log_file is not None:
+                record = {"time": time.time(), "song": song_name, "status": status,
+                          "timings": {phase: round(seconds, 4) for phase, seconds in timings.items()}}
+                if size is not None:
+                    record["bytes"] = size
+                if error is not None:
+                    record["error"] = error
+                self.log_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self.log_file.flush()
+
+    def record_retry(self, phase):
+        with self.lock:
+            self.retries[phase] = self.retries.get(phase, 0) + 1
+
+    def bytes_per_second(self):
+        now = time.monotonic()
+        with self.lock:
+            recent = sum(count for second, count in self.byte_buckets if second > now - RATE_WINDOW)
+        return recent / min(RATE_WINDOW, max(now - self.started, 1))
+
+    def tasks_per_minute(self):
+        now = time.monotonic()
+        with self.lock:
+            while self.finished and self.finished[0] <= now - TASK_WINDOW:
+                self.finished.popleft()
+            recent = len(self.finished)
+        return recent * 60 / min(TASK_WINDOW, max(now - self.started, 1))
+
+    def transfer_progress(self):
+        """
+        (bytes done, bytes expected, finished share) of the transfers in flight.
+        Expected bytes and the share (0..1 per transfer, summed) only count transfers of known length.
+        """
+        with self.lock:
+            known = [(done, total) for done, total in self.transfers.values() if total]
+        return (sum(done for done, _ in known), sum(total for _, total in known),
+                sum(min(done / total, 1.0) for done, total in known))
+
+    def eta(self, unfinished):
+        """
+        seconds until `unfinished` tracks are done, those in flight included, at the current speed.
+        Tracks not started yet are assumed to be as large as the average track so far. None while unknown.
+        """
+        speed = self.bytes_per_second()
+        with self.lock:
+            transfers = list(self.transfers.values())
+            average = self.sized_bytes / self.sized_tracks if self.sized_tracks else None
+        known = [total for _, total in transfers if total]
+        if average is None and known:
+            average = sum(known) / len(known)
+        if not speed or average is None:
+            return None
+        remaining = sum(total - done if total else max(average - done, 0) for done, total in transfers)
+        remaining += max(unfinished - len(transfers), 0) * average
+        return max(remaining, 0) / speed
+
+    def phase_summary(self):
+        """
+        {phase: (count, sum, p50, p99)}
+        """
+        with self.lock:
+            phases = {phase: (count, total, sorted(samples)) for phase, (count, total, samples) in self.phases.items()}
+        return {phase: (count, total, samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))])
+                for phase, (count, total, samples) in phases.items()}
+
+    def prometheus(self, gauges=None):
+        """
+        Prometheus text exposition of the counters, plus extra {name: value} gauges
+        """
+        lines = [
+            "# TYPE oblivionis_bytes_total counter",
+            f"oblivionis_bytes_total {self.bytes_total}",
+            "# TYPE oblivionis_bytes_per_second gauge",
+            f"oblivionis_bytes_per_second {self.bytes_per_second():.1f}",
+            "# TYPE oblivionis_tasks_per_minute gauge",
+            f"oblivionis_tasks_per_minute {self.tasks_per_minute():.2f}",
+            "# TYPE oblivionis_transfer_bytes gauge",
+        ]
+        done, expected, _ = self.transfer_progress()
+        lines += [f'oblivionis_transfer_bytes{{kind="done"}} {done}',
+                  f'oblivionis_transfer_bytes{{kind="expected"}} {expected}',
+                  "# TYPE oblivionis_tracks_total counter"]
+        lines += [f'oblivionis_tracks_total{{status="{status}"}} {count}' for status, count in self.tracks.items()]
+        lines.append("# TYPE oblivionis_retries_total counter")
+        lines += [f'oblivionis_retries_total{{phase="{phase}"}} {count}' for phase, count in self.retries.items()]
+        lines.append("# TYPE oblivionis_phase_seconds summary")
+        for phase, (count, total, p50, p99) in self.phase_summary().items():
+            lines += [
+                f'oblivionis_phase_seconds{{phase="{phase}",quantile="0.5"}} {p50:.4f}',
+                f'oblivionis_phase_seconds{{phase="{phase}",quantile="0.99"}} {p99:.4f}',
+                f'oblivionis_phase_seconds_sum{{phase="{phase}"}} {total:.4f}',
+                f'oblivionis_phase_seconds_count{{phase="{phase}"}} {count}',
+            ]
+        for name, value in (gauges or {}).items():
+            lines += [f"# TYPE oblivionis_{name} gauge", f"oblivionis_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+def format_speed(bytes_per_second):
+    if bytes_per_second < 1024:
+        return f"{bytes_per_second:.0f} B/s"
+    elif bytes_per_second < 1024 * 1024:
+        return f"{bytes_per_second / 1024:.1f} KB/s"
+    else:
+        return f"{bytes_per_second / (1024 * 1024):.1f} MB/s"
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+class MetricsServer:
+    """
+    serves metrics.prometheus() on http://127.0.0.1:<port>/metrics from a daemon thread.
+    gauges: callable returning extra {name: value} gauges at scrape time
+    """
+    def __init__(self, metrics, port, gauges=None):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus(gauges() if gauges else None).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
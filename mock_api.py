@@ -0,0 +1,242 @@
+"""
+Local stand-in for the music API, for benchmarks and offline testing.
+    python mock_api.py [--port 8766] [--latency 0.05] [--bandwidth-kb 0] [--error-rate 0] [--no-range]
+                       [--size-mb 5] [--format mp3|flac|mixed] [--max-br 0]
+then start the app with OBLIVIONIS_API_URL=http://127.0.0.1:8766/api.php
+
+Implements types=search|url|lyric|pic|playlist like BASE_URL. Audio and covers are
+served from /audio/<id>.<ext> and /cover/<id>.jpg with synthetic, deterministic payloads.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+RANGE_REGEX = re.compile(r'bytes=(\d+)-(\d*)$')
+
+def synthetic_audio(ext, size):
+    """
+    `size` bytes that mutagen accepts as an untagged mp3, or as a FLAC stream with 8 KiB of padding
+    """
+    if ext == ".flac":
+        streaminfo = struct.pack(">HH", 4096, 4096) + b"\x00" * 6
+        # 44100 Hz, 2 channels, 16 bit, 44100 * 60 samples
+        streaminfo += ((44100 << 44) | (1 << 41) | (15 << 36) | (44100 * 60)).to_bytes(8, "big")
+        streaminfo += b"\x00" * 16
+        header = b"fLaC" + bytes([0]) + len(streaminfo).to_bytes(3, "big") + streaminfo
+        header += bytes([0x80 | 1]) + (8192).to_bytes(3, "big") + b"\x00" * 8192
+        return header + b"\xff\xf8" * ((size - len(header)) // 2)
+    return b"\xff\xfb\x90\x00" * (size // 4)
+
+def synthetic_lyric(seed, lines=60, translated=False):
+    rng = random.Random(seed)
+    ms = 0
+    text = []
+    for index in range(lines):
+        ms += rng.randint(1500, 5000)
+        stamp = f"[{ms // 60000:02d}:{ms // 1000 % 60:02d}.{ms % 1000 // 10:02d}]"
+        text.append(f"{stamp}{'translation' if translated else 'line'} {index}")
+    return "\n".join(text)
+
+def song_id(*parts):
+    return hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()[:12]
+
+class MockApiServer:
+    """
+    Threaded HTTP server with the BASE_URL contract.
+    latency: seconds before every response, bandwidth: bytes/s per transfer (0 = unlimited),
+    error_rate: share of requests answered with 500 / 429, ranges: honour Range headers.
+    max_bitrate: highest mp3 bitrate the url answer reports, like a source capping a track (0 = none).
+    """
+    def __init__(self, port=0, latency=0.05, bandwidth=0, error_rate=0.0, ranges=True, size=5 * 1024 * 1024,
+                 audio_format="mp3", seed=1, max_bitrate=0):
+        self.max_bitrate = max_bitrate
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.ranges = ranges
+        self.size = size
+        self.audio_format = audio_format
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.payloads = {}
+        self.counts = {}
+        self.count_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self.make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def root_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def api_url(self):
+        return self.root_url + "/api.php"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.api_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def count(self, name):
+        with self.count_lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def fail(self):
+        if not self.error_rate:
+            return None
+        with self.rng_lock:
+            if self.rng.random() >= self.error_rate:
+                return None
+            return self.rng.choice((500, 429))
+
+    def extension(self, track_id):
+        if self.audio_format == "mixed":
+            return ".flac" if int(track_id[-1], 16) % 2 else ".mp3"
+        return "." + self.audio_format
+
+    def payload(self, ext):
+        data = self.payloads.get(ext)
+        if data is None:
+            data = self.payloads[ext] = synthetic_audio(ext, self.size)
+        return data
+
+    def songs(self, source, name, count, page):
+        return [{
+            "id": song_id(source, name, page, index),
+            "name": f"{name} {(page - 1) * count + index}",
+            "artist": [f"{name} artist"],
+            "album": f"{name} album {index % 3}",
+            "pic_id": song_id("pic", source, name, index % 3),
+            "url_id": song_id(source, name, page, index),
+            "lyric_id": song_id(source, name, page, index),
+            "source": source,
+        } for index in range(count)]
+
+    def api(self, params):
+        kind = params.get("types")
+        source = params.get("source", "netease").split("_")[0]
+        if kind == "search":
+            return self.songs(source, params.get("name", ""), int(params.get("count", 20)), int(params.get("pages", 1)))
+        if kind == "playlist":
+            tracks = [{"id": song["id"], "name": song["name"], "ar": [{"name": song["artist"][0]}],
+                       "al": {"name": song["album"], "pic": song["pic_id"]}}
+                      for song in self.songs("netease", f"playlist {params.get('id')}", 50, 1)]
+            return {"playlist": {"tracks": tracks}}
+        if kind == "url":
+            track_id = params.get("id", "")
+            ext = self.extension(track_id)
+            bitrate = int(params.get("br", 320))
+            if self.max_bitrate:
+                bitrate = min(bitrate, self.max_bitrate)
+            return {"url": f"{self.root_url}/audio/{track_id}{ext}",
+                    "br": 999 if ext == ".flac" else bitrate, "size": self.size // 1024}
+        if kind == "lyric":
+            return {"lyric": synthetic_lyric(params.get("id")), "tlyric": synthetic_lyric(params.get("id"), translated=True)}
+        if kind == "pic":
+            return {"url": f"{self.root_url}/cover/{params.get('id')}.jpg"}
+        return {}
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    # clients drop idle keep-alive connections whenever they like
+                    pass
+
+            def send_body(self, status, body, content_type="application/octet-stream", headers=()):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in headers:
+                    self.send_header(key, value)
+                self.end_headers()
+                self.write_throttled(body)
+
+            def write_throttled(self, body):
+                if not server.bandwidth:
+                    self.wfile.write(body)
+                    return
+                chunk = 64 * 1024
+                for start in range(0, len(body), chunk):
+                    self.wfile.write(body[start:start + chunk])
+                    time.sleep(min(chunk, len(body) - start) / server.bandwidth)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                time.sleep(server.latency)
+                status = server.fail()
+                if status:
+                    server.count(f"error {status}")
+                    return self.send_body(status, b"error", "text/plain")
+                if url.path == "/api.php":
+                    params = dict(parse_qsl(url.query))
+                    server.count(params.get("types", "?"))
+                    body = json.dumps(server.api(params)).encode()
+                    return self.send_body(200, body, "application/json")
+                if url.path.startswith("/cover/"):
+                    server.count("cover")
+                    return self.send_body(200, hashlib.sha256(url.path.encode()).digest() * 2048, "image/jpeg")
+                if url.path.startswith("/audio/"):
+                    server.count("audio")
+                    return self.send_audio(url.path)
+                self.send_body(404, b"not found", "text/plain")
+
+            def send_audio(self, path):
+                ext = ".flac" if path.endswith(".flac") else ".mp3"
+                data = server.payload(ext)
+                match = RANGE_REGEX.match(self.headers.get("Range", ""))
+                if not server.ranges or not match:
+                    headers = [("Accept-Ranges", "bytes" if server.ranges else "none")]
+                    return self.send_body(200, data, "audio/mpeg", headers)
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+                if start >= len(data):
+                    return self.send_body(416, b"", "text/plain", [("Content-Range", f"bytes */{len(data)}")])
+                self.send_body(206, data[start:end + 1], "audio/mpeg",
+                               [("Accept-Ranges", "bytes"), ("Content-Range", f"bytes {start}-{end}/{len(data)}")])
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Oblivionis mock music API")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before every response")
+    parser.add_argument("--bandwidth-kb", type=int, default=0, help="KiB/s per transfer, 0 = unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with 500 / 429")
+    parser.add_argument("--no-range", action="store_true", help="ignore Range headers")
+    parser.add_argument("--size-mb", type=float, default=5)
+    parser.add_argument("--format", choices=["mp3", "flac", "mixed"], default="mp3")
+    parser.add_argument("--max-br", type=int, default=0, help="cap the mp3 bitrate of url answers, 0 = none")
+    args = parser.parse_args()
+
+    server = MockApiServer(args.port, args.latency, args.bandwidth_kb * 1024, args.error_rate, not args.no_range,
+                           int(args.size_mb * 1024 * 1024), args.format, max_bitrate=args.max_br)
+    print(f"mock API on {server.api_url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
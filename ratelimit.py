@@ -0,0 +1,118 @@
+import threading
+import time
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose refill rate is tuned by AIMD:
+    every healthy response adds `increase` req/s, a failure (timeout, 429/5xx, empty url)
+    multiplies the rate by `decrease`, at most once per `cooldown` seconds.
+    """
+    def __init__(self, rate=1.0, min_rate=0.1, max_rate=10.0, increase=0.05, decrease=0.5, burst=2, cooldown=2.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.cooldown = cooldown
+
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, reserve=0, cancel_event=None):
+        """
+        block until a request may be sent.
+        Low priority callers pass reserve > 0 and only go when that many tokens
+        would still be left for everyone else.
+        Returns False without taking a token if cancel_event gets set while waiting.
+        """
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            wait = self.try_acquire(reserve)
+            if not wait:
+                return True
+            if cancel_event is not None:
+                cancel_event.wait(wait)
+            else:
+                time.sleep(wait)
+
+    def try_acquire(self, reserve=0):
+        """
+        take a token without blocking: 0 when taken, otherwise the seconds to wait before trying again
+        """
+        needed = min(1 + reserve, self.burst)
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= needed:
+                self.tokens -= 1
+                return 0
+            return (needed - self.tokens) / self.rate
+
+    def on_success(self):
+        with self.lock:
+            self.successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_failure(self):
+        with self.lock:
+            self.failures += 1
+            now = time.monotonic()
+            if now - self.last_decrease >= self.cooldown:
+                self._refill(now)
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.tokens = min(self.tokens, 0)
+                self.last_decrease = now
+
+    def describe(self):
+        return f"{self.rate:.2f} req/s (成功 {self.successes}, 退避 {self.failures})"
+
+class BandwidthGovernor:
+    """
+    Byte budget shared by every transfer stream. Each chunk is booked with reserve()
+    and whatever goes over `rate` bytes/s is slept off by the stream that booked it,
+    so all streams together stay under the ceiling. rate 0 means unlimited;
+    set_rate() takes effect on the next chunk of every running stream.
+    """
+    def __init__(self, rate=0, burst_seconds=0.5):
+        self.rate = rate
+        self.burst_seconds = burst_seconds
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            # debt booked at the old rate is forgiven
+            self.tokens = 0.0
+            self.last_refill = time.monotonic()
+
+    def reserve(self, count):
+        """
+        book `count` bytes without blocking, returns the seconds the caller should wait before its next chunk
+        """
+        if not self.rate:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate * self.burst_seconds, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= count
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def consume(self, count):
+        wait = self.reserve(count)
+        if wait:
+            time.sleep(wait)
+
+    def describe(self):
+        return f"{self.rate / 1024:.0f} KB/s" if self.rate else "不限速"
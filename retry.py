@@ -0,0 +1,102 @@
+import asyncio
+import random
+import time
+
+import requests
+from mutagen import MutagenError
+
+# phases of a track that are retried on their own
+RETRY_PHASES = ("resolve", "transfer", "lyric", "cover", "tag")
+
+# errors that won't go away by asking again
+FINAL_ERRORS = (requests.exceptions.InvalidURL, requests.exceptions.MissingSchema, requests.exceptions.InvalidSchema,
+                PermissionError, FileNotFoundError)
+
+def error_status(exc):
+    """
+    HTTP status of a requests / aiohttp error, None for errors without one
+    """
+    # requests.HTTPError keeps the response, aiohttp.ClientResponseError the status
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(exc, "status", None)
+    return status if isinstance(status, int) else None
+
+def is_client_error(exc):
+    """
+    4xx answer other than 429: the server rejects the request itself, e.g. an expired signed url
+    """
+    status = error_status(exc)
+    return status is not None and 400 <= status < 500 and status != 429
+
+def is_retryable(exc, extra=()):
+    """
+    network errors, timeouts, incomplete transfers, 429 / 5xx answers and failed tag writes.
+    extra: more exception types counted as transient (e.g. aiohttp.ClientError)
+    """
+    if isinstance(exc, FINAL_ERRORS):
+        return False
+    status = error_status(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exc, (requests.exceptions.RequestException, MutagenError, OSError, TimeoutError,
+                            asyncio.TimeoutError) + tuple(extra))
+
+class RetryPolicy:
+    """
+    Attempt budget per phase with exponential backoff and full jitter: after failed
+    attempt n (from 0) the phase waits uniform(0, min(max_delay, base * 2 ** n)) seconds.
+    attempts: {phase: tries including the first}, unknown phases get a single try.
+    on_retry(phase) is called before every wait.
+    """
+    def __init__(self, attempts, base=0.5, max_delay=8.0, on_retry=None):
+        self.attempts = dict(attempts)
+        self.base = base
+        self.max_delay = max_delay
+        self.on_retry = on_retry
+        self.rng = random.Random()
+
+    def set_attempts(self, attempts):
+        self.attempts = {phase: max(1, int(count)) for phase, count in attempts.items()}
+
+    def next_delay(self, phase, attempt, exc, extra=()):
+        """
+        seconds to wait before trying `phase` again after failed attempt `attempt`, None when exc is final
+        """
+        if attempt + 1 >= self.attempts.get(phase, 1) or not is_retryable(exc, extra):
+            return None
+        if self.on_retry is not None:
+            self.on_retry(phase)
+        return self.rng.uniform(0, min(self.max_delay, self.base * 2 ** attempt))
+
+    def call(self, phase, func, *args):
+        attempt = 0
+        while True:
+            try:
+                return func(*args)
+            except Exception as e:
+                wait = self.next_delay(phase, attempt, e)
+                if wait is None:
+                    raise
+            time.sleep(wait)
+            attempt += 1
+
+    async def call_async(self, phase, factory, extra=()):
+        """
+        call for coroutines: factory() makes a fresh awaitable for every attempt
+        """
+        attempt = 0
+        while True:
+            try:
+                return await factory()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                wait = self.next_delay(phase, attempt, e, extra)
+                if wait is None:
+                    raise
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    def describe(self):
+        return ", ".join(f"{phase}:{count}" for phase, count in self.attempts.items())
@@ -0,0 +1,178 @@
+import queue
+import itertools
+import threading
+from collections import deque, OrderedDict
+
+class TaskScheduler:
+    """
+    Download task queue with the queue.Queue interface the engines use (put, get,
+    get_nowait, task_done, join, qsize), but with one queue per batch:
+    workers take tasks round-robin across batches, so a single song queued after a
+    2,000-track playlist starts after at most one task of every other batch.
+    Priority tasks ("download next") go before all batches. Queued tasks can be
+    moved or cancelled until a worker takes them. None (worker wake-up) always goes first.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.all_tasks_done = threading.Condition(self.lock)
+        self.unfinished_tasks = 0
+        self.wakeups = 0
+        self.priority = deque()  # [task_id, batch_id, item]
+        self.batches = OrderedDict()  # batch_id -> deque of [task_id, batch_id, item], in round-robin order
+        self.batch_names = {}
+        self.task_ids = itertools.count(1)
+        self.batch_ids = itertools.count(1)
+
+    def new_batch(self, name=""):
+        with self.lock:
+            batch_id = next(self.batch_ids)
+            self.batch_names[batch_id] = name
+            return batch_id
+
+    def put(self, item, block=True, timeout=None, batch=None, priority=False):
+        """
+        queue item in `batch` (a batch of its own when None), or ahead of all batches with priority.
+        Returns the task id, None for a wake-up.
+        """
+        with self.lock:
+            self.unfinished_tasks += 1
+            if item is None:
+                self.wakeups += 1
+                self.not_empty.notify()
+                return None
+            if batch is None:
+                batch = next(self.batch_ids)
+                self.batch_names[batch] = ""
+            entry = [next(self.task_ids), batch, item]
+            if priority:
+                self.priority.append(entry)
+            else:
+                self.batches.setdefault(batch, deque()).append(entry)
+            self.not_empty.notify()
+            return entry[0]
+
+    def _take(self):
+        if self.wakeups:
+            self.wakeups -= 1
+            return None
+        if self.priority:
+            return self.priority.popleft()[2]
+        batch_id, tasks = next(iter(self.batches.items()))
+        item = tasks.popleft()[2]
+        if tasks:
+            self.batches.move_to_end(batch_id)
+        else:
+            del self.batches[batch_id]
+        return item
+
+    def _qsize(self):
+        return self.wakeups + len(self.priority) + sum(len(tasks) for tasks in self.batches.values())
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            if not block:
+                if not self._qsize():
+                    raise queue.Empty
+            elif not self.not_empty.wait_for(self._qsize, timeout):
+                raise queue.Empty
+            return self._take()
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def task_done(self):
+        with self.all_tasks_done:
+            self.unfinished_tasks -= 1
+            if self.unfinished_tasks <= 0:
+                self.unfinished_tasks = 0
+                self.all_tasks_done.notify_all()
+
+    def join(self):
+        with self.all_tasks_done:
+            self.all_tasks_done.wait_for(lambda: not self.unfinished_tasks)
+
+    def qsize(self):
+        with self.lock:
+            return self._qsize()
+
+    def empty(self):
+        return not self.qsize()
+
+    def _entries(self):
+        """
+        queued [task_id, batch_id, item] in the order get() would hand them out
+        """
+        order = list(self.priority)
+        batches = [list(tasks) for tasks in self.batches.values()]
+        for round_ in itertools.zip_longest(*batches):
+            order.extend(entry for entry in round_ if entry is not None)
+        return order
+
+    def snapshot(self):
+        """
+        [(position from 1, task_id, batch name, item, prioritized)] of every queued task, in dispatch order
+        """
+        with self.lock:
+            priority_ids = {entry[0] for entry in self.priority}
+            return [(position, task_id, self.batch_names.get(batch_id, ""), item, task_id in priority_ids)
+                    for position, (task_id, batch_id, item) in enumerate(self._entries(), 1)]
+
+    def _remove(self, task_ids):
+        removed = [entry for entry in self.priority if entry[0] in task_ids]
+        if removed:
+            self.priority = deque(entry for entry in self.priority if entry[0] not in task_ids)
+        for batch_id, tasks in list(self.batches.items()):
+            kept = deque(entry for entry in tasks if entry[0] not in task_ids)
+            if len(kept) == len(tasks):
+                continue
+            removed += [entry for entry in tasks if entry[0] in task_ids]
+            if kept:
+                self.batches[batch_id] = kept
+            else:
+                del self.batches[batch_id]
+        return removed
+
+    def cancel(self, task_ids):
+        """
+        drop queued tasks, returns the items removed (tasks already taken by a worker are not affected)
+        """
+        with self.all_tasks_done:
+            removed = self._remove(set(task_ids))
+            self.unfinished_tasks -= len(removed)
+            if removed and self.unfinished_tasks <= 0:
+                self.unfinished_tasks = 0
+                self.all_tasks_done.notify_all()
+            return [item for _, _, item in removed]
+
+    def cancel_batches(self, task_ids):
+        """
+        drop every queued task of the batches the given tasks belong to, returns the items removed
+        """
+        task_ids = set(task_ids)
+        with self.lock:
+            batch_ids = {entry[1] for entry in self._entries() if entry[0] in task_ids}
+            batch_task_ids = [entry[0] for entry in self._entries() if entry[1] in batch_ids]
+        return self.cancel(batch_task_ids)
+
+    def prioritize(self, task_ids):
+        """
+        "download next": move tasks ahead of all batches, in their current order
+        """
+        task_ids = set(task_ids)
+        with self.lock:
+            ordered = [entry[0] for entry in self._entries() if entry[0] in task_ids]
+            removed = {entry[0]: entry for entry in self._remove(set(ordered))}
+            self.priority.extend(removed[task_id] for task_id in ordered)
+
+    def deprioritize(self, task_ids):
+        """
+        move tasks back to the end of their own batch
+        """
+        task_ids = set(task_ids)
+        with self.lock:
+            ordered = [entry[0] for entry in self._entries() if entry[0] in task_ids]
+            removed = {entry[0]: entry for entry in self._remove(set(ordered))}
+            for task_id in ordered:
+                entry = removed[task_id]
+                self.batches.setdefault(entry[1], deque()).append(entry)
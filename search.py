@@ -1,4 +1,19 @@
-from configure import *
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from api import *
+from cache import SearchCache, CACHE_MODES
+
+search_cache = SearchCache(SEARCH_CACHE_FILE, DEFAULT_CONFIG["search_cache_mode"],
+                           DEFAULT_CONFIG["search_cache_ttl_minutes"] * 60, DEFAULT_CONFIG["search_cache_max_entries"])
+
+def apply_cache_config(config):
+    search_cache.configure(config.get("search_cache_mode", DEFAULT_CONFIG["search_cache_mode"]),
+                           int(config.get("search_cache_ttl_minutes", DEFAULT_CONFIG["search_cache_ttl_minutes"])) * 60,
+                           int(config.get("search_cache_max_entries", DEFAULT_CONFIG["search_cache_max_entries"])))
 
 def result_convert(playlist_data, source="netease"):
     """
@@ -31,16 +46,95 @@ def result_convert(playlist_data, source="netease"):
 
     return search_format_list
 
-def search_worker(params, search_id):
+def search(params, low_priority=False, cancel=None, timeout=15):
+    """
+    blocking search, shared by search_worker and batch mode. Successful results are stored in search_cache
+    """
+    resp = api_get(params, timeout=timeout, low_priority=low_priority, cancel=cancel)
+    if isinstance(resp, dict):
+        if "playlist" in resp:
+            resp = result_convert(resp)
+    search_cache.put(params, resp)
+    return resp
+
+class SearchPrefetcher:
+    """
+    Fetches neighbouring search pages in the background at low priority, so that a
+    page click can be served without a round-trip. Keeps at most `max_entries`
+    unused pages and sends at most `budget` prefetch requests per session.
+    """
+    def __init__(self, max_entries=4, budget=100):
+        self.max_entries = max_entries
+        self.budget = budget
+        self.results = OrderedDict()  # key -> resp
+        self.pending = set()
+        self.issued = 0
+        self.used = 0
+        self.wasted = 0
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.thread = None
+
+    def request(self, params):
+        key = SearchCache.make_key(params)
+        with self.lock:
+            if key in self.results or key in self.pending or self.issued >= self.budget:
+                return
+            if search_cache.contains(params):
+                return
+            self.pending.add(key)
+            self.issued += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.worker, daemon=True)
+                self.thread.start()
+        self.requests.put((key, params))
+
+    def take(self, params):
+        """
+        prefetched result for params, or None
+        """
+        key = SearchCache.make_key(params)
+        with self.lock:
+            resp = self.results.pop(key, None)
+            if resp is not None:
+                self.used += 1
+            return resp
+
+    def worker(self):
+        while True:
+            key, params = self.requests.get()
+            try:
+                resp = search(params, low_priority=True)
+            except Exception:
+                resp = None
+            with self.lock:
+                self.pending.discard(key)
+                if resp and isinstance(resp, list):
+                    self.results[key] = resp
+                    while len(self.results) > self.max_entries:
+                        self.results.popitem(last=False)
+                        self.wasted += 1
+
+    def describe(self):
+        rate = self.used * 100 / self.issued if self.issued else 0
+        return f"预取 {self.issued} 页, 使用 {self.used} 页 (利用率 {rate:.0f}%), 丢弃 {self.wasted} 页"
+
+search_prefetcher = SearchPrefetcher(PREFETCH_MAX_ENTRIES, DEFAULT_CONFIG["prefetch_budget"])
+
+def apply_prefetch_config(config):
+    search_prefetcher.budget = int(config.get("prefetch_budget", DEFAULT_CONFIG["prefetch_budget"]))
+
+def search_worker(params, search_id, cancel=None):
     """
-    search music thread
+    search music thread, a cancelled search reports nothing
     """
     try:
-        resp = session.get(BASE_URL, params=params, timeout=15).json()
-        if isinstance(resp, dict):
-            if "playlist" in resp:
-                resp = result_convert(resp)
+        resp = search(params, cancel=cancel)
+        if cancel is not None and cancel.cancelled:
+            return
         search_queue.put(("success", resp, search_id))
+    except RequestCancelled:
+        pass
     except requests.exceptions.Timeout:
         search_queue.put(("error", "搜索请求超时，请检查网络或稍后再试", search_id))
     except requests.exceptions.RequestException as e:
@@ -48,18 +142,170 @@ def search_worker(params, search_id):
     except Exception as e:
         search_queue.put(("error", f"网络错误或API无响应: {e}", search_id))
 
-def pic_worker(params, pic_id):
+def normalize_text(text):
+    return "".join(ch for ch in unicodedata.normalize("NFKC", str(text)).casefold() if ch.isalnum())
+
+def normalize_song_key(song):
+    """
+    (title, artist, album) with case, width and punctuation differences removed
+    """
+    artist = song.get("artist", "")
+    if isinstance(artist, list):
+        artist = "/".join(str(name) for name in artist)
+    return normalize_text(song.get("name", "")), normalize_text(artist), normalize_text(song.get("album", ""))
+
+def merge_federated(merged, songs, preference):
+    """
+    Merge one source's songs into `merged` (key -> (rank, position, song)), keeping
+    the copy from the most preferred source for every normalized key.
+    Returns the merged songs ranked by source preference, then by position in their source.
+    """
+    for position, song in enumerate(songs):
+        source = song.get("source", "")
+        rank = preference.index(source) if source in preference else len(preference)
+        key = normalize_song_key(song)
+        if key not in merged or rank < merged[key][0]:
+            merged[key] = (rank, position, song)
+    return [song for _, _, song in sorted(merged.values(), key=lambda entry: entry[:2])]
+
+def federated_search_worker(params, sources, suffix, search_id, cancel=None, timeout=FEDERATED_TIMEOUT):
+    """
+    Send the same search to every source at once. Each answer is put into search_queue as soon as
+    it arrives, ("partial", (source, songs), search_id), so a slow source never holds back the others;
+    ("done", failed_sources, search_id) follows the last one.
+    """
+    def search_source(source):
+        source_params = {**params, "source": source + suffix}
+        cached = search_cache.get(source_params)
+        if cached is not None:
+            return cached
+        return search(source_params, cancel=cancel, timeout=timeout)
+
+    failed = []
+    executor = ThreadPoolExecutor(max_workers=len(sources))
+    try:
+        futures = {executor.submit(search_source, source): source for source in sources}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                resp = future.result()
+            except RequestCancelled:
+                return
+            except requests.exceptions.Timeout:
+                failed.append(f"{source}: 超时")
+                continue
+            except Exception as e:
+                failed.append(f"{source}: {e}")
+                continue
+            if cancel is not None and cancel.cancelled:
+                return
+            search_queue.put(("partial", (source, resp if isinstance(resp, list) else []), search_id))
+    finally:
+        # a cancelled search doesn't wait for the sources still answering, their results are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+    search_queue.put(("done", failed, search_id))
+
+class SearchManager:
+    """
+    Runs the searches of one UI one after another from a single thread.
+    submit() replaces a search that hasn't started and cancels the running one at the
+    transport level. Each search runs on a thread of its own, so a cancelled one is
+    abandoned right away: it ends on its own once its response arrives (or its rate-limit
+    wait is cut short) and reports nothing, while the next search starts without waiting for it.
+    Submissions less than `debounce` seconds apart are coalesced: only the last one runs,
+    once the submissions stop.
+    """
+    def __init__(self, debounce=0.3):
+        self.debounce = debounce
+        self.cond = threading.Condition()
+        self.pending = None  # [params, search_id, not_before, federated]
+        self.running = None  # CancelToken of the search in flight
+        self.last_submit = 0.0
+        self.thread = None
+        self.submitted = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def submit(self, params, search_id, federated=None):
+        """
+        federated: (sources, api source suffix) to fan the search out to several sources
+        """
+        with self.cond:
+            now = time.monotonic()
+            not_before = now + self.debounce if now - self.last_submit < self.debounce else now
+            self.last_submit = now
+            self.submitted += 1
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = [params, search_id, not_before, federated]
+            self._cancel_running()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.worker, daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def cancel(self):
+        """
+        drop the pending search and abandon the running one, e.g. when a result came from cache
+        """
+        with self.cond:
+            if self.pending is not None:
+                self.coalesced += 1
+                self.pending = None
+            self._cancel_running()
+
+    def _cancel_running(self):
+        if self.running is not None and not self.running.cancelled:
+            self.cancelled += 1
+            self.running.cancel()
+            self.cond.notify_all()
+
+    def worker(self):
+        while True:
+            with self.cond:
+                while True:
+                    if self.pending is None:
+                        self.cond.wait()
+                        continue
+                    remaining = self.pending[2] - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                params, search_id, _, federated = self.pending
+                self.pending = None
+                self.running = token = CancelToken()
+                finished = []
+            thread = threading.Thread(target=self.run, args=(params, search_id, federated, token, finished), daemon=True)
+            thread.start()
+            with self.cond:
+                # until the search ends or is superseded, an abandoned one finishes on its own thread
+                self.cond.wait_for(lambda: finished or token.cancelled)
+                self.running = None
+
+    def run(self, params, search_id, federated, token, finished):
+        try:
+            if federated:
+                federated_search_worker(params, *federated, search_id, token)
+            else:
+                search_worker(params, search_id, token)
+        finally:
+            with self.cond:
+                finished.append(True)
+                self.cond.notify_all()
+
+    def describe(self):
+        return f"搜索请求 {self.submitted} 次, 合并 {self.coalesced} 次, 中途取消 {self.cancelled} 次"
+
+def pic_worker(source, pic_id, size):
     """
-    get pic thread
+    get pic thread, covers come from the shared cover_cache
     """
     try:
-        resp = session.get(BASE_URL, params=params, timeout=10).json()
-        url = resp.get("url")
-        if url:
-            img_data = session.get(url, timeout=10).content
+        img_data = get_cover(source, pic_id, size, timeout=10)
+        if img_data:
             pic_queue.put(("success", img_data, pic_id))
         else:
-            pic_queue.put(("error", "专辑封面未找到"))
+            pic_queue.put(("error", "专辑封面未找到", pic_id))
     except requests.exceptions.Timeout:
         pic_queue.put(("error", "封面加载超时，请检查网络", pic_id))
     except requests.exceptions.RequestException as e:
@@ -0,0 +1,149 @@
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# host pools kept per session: the API is one host, covers and audio come from a few CDNs
+API_HOST_POOLS = 2
+MEDIA_HOST_POOLS = 10
+
+class PoolStats:
+    """
+    Connection pool counters of one session, per host:
+    requests (connection checkouts), new connections, checkouts that found the pool
+    empty and had to open an extra connection, connections discarded because the
+    pool was full, and seconds spent getting a connection.
+    """
+    FIELDS = ("requests", "new", "exhausted", "discarded", "wait")
+
+    def __init__(self, name):
+        self.name = name
+        self.hosts = {}  # host -> {field: value}
+        self.lock = threading.Lock()
+
+    def add(self, host, field, value=1):
+        with self.lock:
+            counters = self.hosts.setdefault(host, dict.fromkeys(self.FIELDS, 0))
+            counters[field] += value
+
+    def totals(self):
+        with self.lock:
+            return {field: sum(counters[field] for counters in self.hosts.values()) for field in self.FIELDS}
+
+    def describe(self):
+        totals = self.totals()
+        checkouts = totals["requests"]
+        reuse = (checkouts - totals["new"]) * 100 / checkouts if checkouts else 0
+        return (f"{self.name}: 请求 {checkouts}, 复用率 {reuse:.0f}%, 新建连接 {totals['new']}, "
+                f"池满新建 {totals['exhausted']}, 丢弃 {totals['discarded']}, 等待 {totals['wait']:.2f}s")
+
+def counting_pool_class(base, stats, adapter):
+    class CountingPool(base):
+        def _get_conn(self, timeout=None):
+            if self.pool is not None and self.pool.empty():
+                stats.add(self.host, "exhausted")
+            start = time.perf_counter()
+            conn = super()._get_conn(timeout)
+            stats.add(self.host, "wait", time.perf_counter() - start)
+            stats.add(self.host, "requests")
+            adapter.checked_out(1)
+            return conn
+
+        def _new_conn(self):
+            stats.add(self.host, "new")
+            return super()._new_conn()
+
+        def _put_conn(self, conn):
+            if conn is not None and self.pool is not None and self.pool.full():
+                stats.add(self.host, "discarded")
+            super()._put_conn(conn)
+            # every checkout is put back, with None when the connection was thrown away
+            adapter.checked_out(-1)
+
+    return CountingPool
+
+class CountingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connection pools report to a PoolStats and count the
+    connections checked out of them. Once retired (replaced by a newer adapter)
+    it closes its pools as soon as none is checked out any more.
+    """
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        self.in_flight = 0
+        self.retired = False
+        self.closed = False
+        self.lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": counting_pool_class(HTTPConnectionPool, self.stats, self),
+            "https": counting_pool_class(HTTPSConnectionPool, self.stats, self),
+        }
+
+    def checked_out(self, delta):
+        with self.lock:
+            self.in_flight += delta
+        self._close_if_idle()
+
+    def retire(self):
+        with self.lock:
+            self.retired = True
+        self._close_if_idle()
+
+    def _close_if_idle(self):
+        with self.lock:
+            if not self.retired or self.closed or self.in_flight > 0:
+                return
+            self.closed = True
+        self.close()
+        with retired_lock:
+            retired_adapters.discard(self)
+
+api_stats = PoolStats("API")
+media_stats = PoolStats("媒体")
+# BASE_URL only
+api_session = requests.Session()
+# audio and cover downloads, so CDN transfers never take connections from API calls
+media_session = requests.Session()
+# adapters replaced by a settings change, until their last in-flight response is done
+retired_adapters = set()
+retired_lock = threading.Lock()
+
+def pool_sizes(config):
+    """
+    (API, media) connections kept alive per host for these settings
+    """
+    downloads = int(config.get("max_downloads", 3))
+    segments = max(1, int(config.get("segment_count", 4)))
+    # lyric + pic of every running track (its url comes before them), plus search / prefetch
+    api_size = downloads * 2 + 4
+    # every segment of every running track, plus its cover
+    media_size = downloads * segments + downloads
+    return api_size, media_size
+
+def mount_pools(session, stats, host_pools, size):
+    adapter = CountingAdapter(stats, pool_connections=host_pools, pool_maxsize=size)
+    old = session.adapters.get("https://")
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if isinstance(old, CountingAdapter):
+        # not closed under in-flight responses: it closes itself once they are done.
+        # Its counters live in the shared PoolStats and stay in the totals
+        with retired_lock:
+            retired_adapters.add(old)
+        old.retire()
+
+def apply_transport_config(config):
+    api_size, media_size = pool_sizes(config)
+    mount_pools(api_session, api_stats, API_HOST_POOLS, api_size)
+    mount_pools(media_session, media_stats, MEDIA_HOST_POOLS, media_size)
+
+def describe_pools():
+    return f"{api_stats.describe()}\n{media_stats.describe()}"
+
+apply_transport_config({})
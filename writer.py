@@ -0,0 +1,119 @@
+import os
+
+FSYNC_MODES = ["不同步", "下载完成时同步", "每次写入缓冲后同步"]
+
+# next to a preallocated .part: how many bytes of it were really written
+PROGRESS_SUFFIX = ".progress"
+
+def preallocate(fd, offset, length):
+    """
+    reserve disk blocks for [offset, offset + length) so concurrent streams don't fragment each other.
+    Best effort: skipped where posix_fallocate is missing (Windows, macOS) or the filesystem refuses it.
+    """
+    if length <= 0 or not hasattr(os, "posix_fallocate"):
+        return False
+    try:
+        os.posix_fallocate(fd, offset, length)
+        return True
+    except OSError:
+        return False
+
+def save_progress(path, position):
+    with open(path + PROGRESS_SUFFIX, "w", encoding="utf-8") as f:
+        f.write(str(position))
+
+def discard_progress(path):
+    if os.path.exists(path + PROGRESS_SUFFIX):
+        os.remove(path + PROGRESS_SUFFIX)
+
+def written_size(path):
+    """
+    Bytes of a .part file that can be resumed from. A preallocated file is full size from the
+    start, so while its .progress sidecar exists only the count in there is trusted (0 when the
+    sidecar can't be read); otherwise every byte of the file was written.
+    """
+    if not os.path.exists(path):
+        return 0
+    size = os.path.getsize(path)
+    if not os.path.exists(path + PROGRESS_SUFFIX):
+        return size
+    try:
+        with open(path + PROGRESS_SUFFIX, "r", encoding="utf-8") as f:
+            return min(int(f.read()), size)
+    except (IOError, ValueError):
+        return 0
+
+class PartWriter:
+    """
+    Writes a download stream into a .part file from `start` through a `buffer_size` buffer.
+    With `total` known, the rest of the file is preallocated. Until close() cuts the file back
+    to the bytes actually written, its .progress sidecar holds the written count (see written_size),
+    updated at every checkpoint, so a crash mid-transfer can't pass the file off as complete.
+    truncate=False keeps what lies behind `start` (segments of a file written in parallel).
+    fsync_mode is one of FSYNC_MODES.
+    on_checkpoint(position) is called whenever every byte before position has reached the OS.
+    """
+    def __init__(self, path, start=0, total=None, mode="r+b", buffer_size=1024 * 1024, fsync_mode=FSYNC_MODES[0],
+                 allocate=True, truncate=True, on_checkpoint=None):
+        self.path = path
+        self.file = open(path, mode, buffering=buffer_size)
+        self.file.seek(start)
+        if truncate:
+            self.file.truncate()
+        self.position = start
+        self.buffer_size = buffer_size
+        self.fsync_mode = fsync_mode
+        self.on_checkpoint = on_checkpoint
+        self.pending = 0  # bytes written since the last checkpoint
+        self.allocated = False
+        if allocate and total is not None and total > start:
+            # recorded before the file grows past the written bytes
+            save_progress(path, start)
+            self.allocated = preallocate(self.file.fileno(), start, total - start)
+        if not self.allocated and truncate:
+            # the size is the written count again, a sidecar of an earlier run would only hold it back
+            discard_progress(path)
+
+    def write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+        self.pending += len(data)
+        if self.pending >= self.buffer_size:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        hand the buffer to the OS (and the disk for 每次写入缓冲后同步), then record the position as written
+        """
+        self.file.flush()
+        if self.fsync_mode == FSYNC_MODES[2]:
+            os.fsync(self.file.fileno())
+        self.pending = 0
+        if self.allocated:
+            save_progress(self.path, self.position)
+        if self.on_checkpoint is not None:
+            self.on_checkpoint(self.position)
+
+    def close(self, complete=False):
+        """
+        complete: the stream ended normally, syncs for 下载完成时同步
+        """
+        try:
+            self.file.flush()
+            if self.allocated:
+                # drop preallocated blocks past the last written byte
+                self.file.truncate(self.position)
+            if (complete and self.fsync_mode != FSYNC_MODES[0]) or (self.pending and self.fsync_mode == FSYNC_MODES[2]):
+                os.fsync(self.file.fileno())
+        finally:
+            self.file.close()
+        if self.allocated:
+            discard_progress(self.path)
+        if self.on_checkpoint is not None:
+            self.on_checkpoint(self.position)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(exc_type is None)